@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pygame
+
+class BackgroundLayer:
+  """Renders a procedural background on a worker thread.
+
+  `bg` can be any of the ProceduralBG classes from the raymarch experiments:
+  anything with an `update(dt)` method and a `surface` it draws into. The
+  worker copies each finished frame into a back buffer and swaps it with the
+  front buffer under a lock, so the main loop always composites the most
+  recent complete frame and never waits for a frame to be rendered.
+  """
+  def __init__(self, bg, fps=30):
+    self.bg = bg
+    self.fps = fps
+    size = bg.surface.get_size()
+    self.front = pygame.Surface(size)
+    self.back = pygame.Surface(size)
+    self.scaled = None
+    self.lock = threading.Lock()
+    self.has_frame = False
+    self.frames_rendered = 0
+    self.stop_event = threading.Event()
+    self.thread = None
+
+  def start(self):
+    if self.thread is not None:
+      return
+    self.stop_event.clear()
+    self.thread = threading.Thread(target=self.run, name="background-layer", daemon=True)
+    self.thread.start()
+
+  def stop(self):
+    if self.thread is None:
+      return
+    self.stop_event.set()
+    self.thread.join()
+    self.thread = None
+
+  def run(self):
+    frame_time = 1 / self.fps
+    previous = time.perf_counter()
+    while not self.stop_event.is_set():
+      now = time.perf_counter()
+      dt, previous = now - previous, now
+      self.bg.update(dt)
+      self.back.blit(self.bg.surface, (0, 0))
+      with self.lock:
+        self.front, self.back = self.back, self.front
+        self.has_frame = True
+      self.frames_rendered += 1
+      # wait out the rest of the frame, but wake up straight away on stop()
+      self.stop_event.wait(max(0, frame_time - (time.perf_counter() - now)))
+
+  def render(self, target_surface):
+    """Blit the latest finished frame, scaled to cover target_surface."""
+    size = target_surface.get_size()
+    if self.scaled is None or self.scaled.get_size() != size:
+      self.scaled = pygame.Surface(size)
+    with self.lock:
+      if not self.has_frame:
+        return False
+      pygame.transform.scale(self.front, size, self.scaled)
+    target_surface.blit(self.scaled, (0, 0))
+    return True
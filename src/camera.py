@@ -0,0 +1,27 @@
+import pygame
+
+class Camera:
+  """Top-left corner of the view in world pixels, following a target.
+
+  `zoom` is the number of screen pixels per world pixel, so the view can be
+  rendered into a target smaller (or larger) than the world area it shows.
+  """
+  def __init__(self, view_width, view_height, zoom=1):
+    self.view_width = view_width
+    self.view_height = view_height
+    self.zoom = zoom
+    self.x = 0
+    self.y = 0
+
+  def follow(self, target_x, target_y, world_width, world_height):
+    # keep the target centred, but never show anything outside the world
+    x = target_x - self.view_width / 2
+    y = target_y - self.view_height / 2
+    self.x = round(max(0, min(x, world_width - self.view_width)))
+    self.y = round(max(0, min(y, world_height - self.view_height)))
+
+  def view_rect(self):
+    return pygame.Rect(self.x, self.y, self.view_width, self.view_height)
+
+  def to_screen(self, x, y):
+    return (x - self.x) * self.zoom, (y - self.y) * self.zoom
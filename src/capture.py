@@ -0,0 +1,139 @@
+import os
+import queue
+import struct
+import threading
+import zlib
+
+import numpy as np
+import pygame
+
+# fast over small, the encoder has to keep up with the game
+PNG_COMPRESSION = 1
+
+def png_chunk(kind, data):
+  return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+class FrameCapture:
+  """Records frames of a surface without stalling the game loop.
+
+  capture() copies the surface's pixels into one of a fixed set of buffers
+  and queues it; a worker thread writes the queued frames out either as a
+  numbered PNG sequence in `path` or appended to a single raw video file at
+  `path`. When the worker falls behind and every buffer is waiting to be
+  written, new frames are dropped instead of blocking, and counted in
+  `dropped`. `high_water` is the deepest the queue has been.
+
+  Raw files are plain frames with no header, one after another, in
+  `pixel_format` (ffmpeg's name for it) at `size`.
+  """
+  def __init__(self, path, format="png", max_queue=8):
+    if format not in ("png", "raw"):
+      raise ValueError(f"unknown capture format {format!r}")
+    self.path = path
+    self.format = format
+    self.max_queue = max_queue
+    self.queue = queue.Queue(max_queue)
+    self.free = queue.Queue()
+    self.size = None
+    self.pixel_format = None
+    self.file = None
+    self.captured = 0
+    self.dropped = 0
+    self.written = 0
+    self.high_water = 0
+    self.thread = None
+
+  @property
+  def running(self):
+    return self.thread is not None
+
+  def start(self, surface):
+    if self.thread is not None:
+      return
+    self.size = surface.get_size()
+    self.pixel_format = ffmpeg_pixel_format(surface)
+    # buffers are (height, width) so a frame is a single contiguous copy
+    pixels = pygame.surfarray.pixels2d(surface)
+    for _ in range(self.max_queue):
+      self.free.put(np.empty(pixels.T.shape, pixels.dtype))
+    del pixels
+    if self.format == "png":
+      os.makedirs(self.path, exist_ok=True)
+      self.file = None
+    else:
+      os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+      self.file = open(self.path, "wb")
+    self.thread = threading.Thread(target=self.run, name="frame-capture", daemon=True)
+    self.thread.start()
+
+  def stop(self):
+    """Writes out whatever is still queued and stops the worker."""
+    if self.thread is None:
+      return
+    self.queue.put(None)
+    self.thread.join()
+    self.thread = None
+    if self.file:
+      self.file.close()
+    while not self.free.empty():
+      self.free.get_nowait()
+
+  def capture(self, surface):
+    if self.thread is None:
+      return False
+    try:
+      buffer = self.free.get_nowait()
+    except queue.Empty:
+      self.dropped += 1
+      return False
+    pixels = pygame.surfarray.pixels2d(surface)
+    np.copyto(buffer, pixels.T)
+    del pixels
+    self.queue.put_nowait((self.captured, buffer))
+    self.captured += 1
+    self.high_water = max(self.high_water, self.queue.qsize())
+    return True
+
+  def run(self):
+    while True:
+      item = self.queue.get()
+      if item is None:
+        return
+      index, buffer = item
+      if self.file:
+        self.file.write(buffer.data)
+      else:
+        self.write_png(os.path.join(self.path, f"frame_{index:05d}.png"), buffer)
+      self.written += 1
+      self.free.put(buffer)
+
+  def write_png(self, path, buffer):
+    # encoded here rather than with pygame.image.save, which holds on to the
+    # GIL for the whole encode, while zlib lets the game loop carry on
+    height, width = buffer.shape
+    channels = buffer.view(np.uint8).reshape(height, width, 4)
+    rows = np.zeros((height, 1 + width * 3), np.uint8)
+    pixels = rows[:, 1:].reshape(height, width, 3)
+    for i, name in enumerate("rgb"):
+      pixels[:, :, i] = channels[:, :, self.pixel_format.index(name)]
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    with open(path, "wb") as file:
+      file.write(b"\x89PNG\r\n\x1a\n")
+      file.write(png_chunk(b"IHDR", header))
+      file.write(png_chunk(b"IDAT", zlib.compress(rows.data, PNG_COMPRESSION)))
+      file.write(png_chunk(b"IEND", b""))
+
+  def stats(self):
+    return {
+      "captured": self.captured,
+      "dropped": self.dropped,
+      "written": self.written,
+      "queued": self.queue.qsize(),
+      "high_water": self.high_water,
+    }
+
+def ffmpeg_pixel_format(surface):
+  # byte order of a 32 bit pixel in memory, pygame surfaces are little endian
+  r, g, b, a = surface.get_masks()
+  names = {r: "r", g: "g", b: "b", a: "a"}
+  return "".join(names.get(0xff << (8 * i), "0") for i in range(4))
@@ -0,0 +1,86 @@
+from collections import OrderedDict
+
+import pygame
+
+class Chunk:
+  def __init__(self, x, y, tiles, surface):
+    # top-left corner in world pixels
+    self.x = x
+    self.y = y
+    self.tiles = tiles
+    self.surface = surface
+
+class ChunkedTilemap:
+  """Splits a tilemap into chunk_size x chunk_size tile chunks.
+
+  Chunks are cut out of the level source the first time they are needed and
+  get a cached surface with their tiles drawn on it, so drawing the map is one
+  blit per visible chunk no matter how big the level is. At most
+  max_loaded_chunks stay loaded; the least recently used ones are dropped and
+  their surfaces go back to the pool. `scale` is the size of a world pixel on
+  the chunk surfaces, matching the camera zoom they get drawn with.
+  """
+  def __init__(self, source, tile_size, surface_pool, chunk_size=8, max_loaded_chunks=64, scale=1):
+    self.source = source
+    self.tile_size = tile_size
+    self.scale = scale
+    self.surface_pool = surface_pool
+    self.chunk_size = chunk_size
+    self.max_loaded_chunks = max_loaded_chunks
+    self.width = len(source[0])
+    self.height = len(source)
+    self.pixel_width = self.width * tile_size
+    self.pixel_height = self.height * tile_size
+    self.chunks = OrderedDict()
+
+  def load_chunk(self, chunk_x, chunk_y):
+    left = chunk_x * self.chunk_size
+    top = chunk_y * self.chunk_size
+    tiles = [row[left:left + self.chunk_size] for row in self.source[top:top + self.chunk_size]]
+    # tile edges in surface pixels, rounded once so neighbouring tiles line up
+    edges = [round(i * self.tile_size * self.scale) for i in range(self.chunk_size + 1)]
+    surface = self.surface_pool.acquire((edges[-1], edges[-1]))
+    # black is the colour key so whatever is behind the tilemap shows through
+    surface.fill((0, 0, 0))
+    surface.set_colorkey((0, 0, 0), pygame.RLEACCEL)
+    line_width = max(1, round(2 * self.scale))
+    for row_index, row in enumerate(tiles):
+      for column_index, entry in enumerate(row):
+        if not entry:
+          continue
+        x, y = edges[column_index], edges[row_index]
+        w, h = edges[column_index + 1] - x, edges[row_index + 1] - y
+        pygame.draw.rect(surface, (255, 255, 255), (x, y, w, h), line_width)
+    return Chunk(left * self.tile_size, top * self.tile_size, tiles, surface)
+
+  def get_chunk(self, chunk_x, chunk_y):
+    key = (chunk_x, chunk_y)
+    chunk = self.chunks.get(key)
+    if chunk is None:
+      chunk = self.chunks[key] = self.load_chunk(chunk_x, chunk_y)
+      while len(self.chunks) > self.max_loaded_chunks:
+        _, evicted = self.chunks.popitem(last=False)
+        self.unload_chunk(evicted)
+    else:
+      self.chunks.move_to_end(key)
+    return chunk
+
+  def unload_chunk(self, chunk):
+    chunk.surface.set_colorkey(None)
+    self.surface_pool.release(chunk.surface)
+    chunk.surface = None
+
+  def chunks_in_rect(self, rect):
+    chunk_pixels = self.chunk_size * self.tile_size
+    first_x = max(0, rect.left // chunk_pixels)
+    first_y = max(0, rect.top // chunk_pixels)
+    last_x = min((self.width - 1) // self.chunk_size, (rect.right - 1) // chunk_pixels)
+    last_y = min((self.height - 1) // self.chunk_size, (rect.bottom - 1) // chunk_pixels)
+    for chunk_y in range(first_y, last_y + 1):
+      for chunk_x in range(first_x, last_x + 1):
+        yield self.get_chunk(chunk_x, chunk_y)
+
+  def release(self):
+    for chunk in self.chunks.values():
+      self.unload_chunk(chunk)
+    self.chunks.clear()
@@ -0,0 +1,92 @@
+import math
+
+# stands in for "no feature in this row/column yet" in the distance transform
+FAR = 1e20
+
+def squared_distance_1d(f):
+  """1D squared Euclidean distance transform (Felzenszwalb & Huttenlocher).
+
+  Computes min over p of (q - p)^2 + f[p] for every q in linear time by
+  building the lower envelope of the parabolas rooted at each sample.
+  """
+  n = len(f)
+  d = [0.0] * n
+  v = [0] * n
+  z = [0.0] * (n + 1)
+  k = 0
+  z[0] = -math.inf
+  z[1] = math.inf
+  for q in range(1, n):
+    while True:
+      p = v[k]
+      s = ((f[q] + q * q) - (f[p] + p * p)) / (2 * q - 2 * p)
+      if s > z[k]:
+        break
+      k -= 1
+    k += 1
+    v[k] = q
+    z[k] = s
+    z[k + 1] = math.inf
+  k = 0
+  for q in range(n):
+    while z[k + 1] < q:
+      k += 1
+    p = v[k]
+    d[q] = (q - p) * (q - p) + f[p]
+  return d
+
+def distance_transform(features):
+  """Euclidean distance (in cells) from every cell to the nearest True cell."""
+  height = len(features)
+  width = len(features[0])
+  grid = [[0.0 if cell else FAR for cell in row] for row in features]
+  for x in range(width):
+    column = squared_distance_1d([grid[y][x] for y in range(height)])
+    for y in range(height):
+      grid[y][x] = column[y]
+  return [[math.sqrt(value) for value in squared_distance_1d(row)] for row in grid]
+
+class DistanceField:
+  """Signed distance to the solid tiles of a tilemap, sampled on a grid.
+
+  The tilemap is sampled at `resolution` cells per tile, with a one cell
+  border of solid around it because everything outside the map counts as a
+  wall. Positive values are a guaranteed lower bound on the distance (in
+  pixels) from anywhere inside the cell to the nearest wall, so a ray can
+  safely advance that far in one go. Free cells right next to a wall read 0
+  and cells inside walls are negative.
+  """
+  def __init__(self, tilemap, tile_size, resolution=4):
+    self.resolution = resolution
+    self.cell_size = tile_size / resolution
+    self.width = len(tilemap[0]) * resolution + 2
+    self.height = len(tilemap) * resolution + 2
+
+    solid = [[True] * self.width for _ in range(self.height)]
+    for y in range(1, self.height - 1):
+      row = tilemap[(y - 1) // resolution]
+      for x in range(1, self.width - 1):
+        solid[y][x] = row[(x - 1) // resolution] == 1
+
+    to_wall = distance_transform(solid)
+    to_space = distance_transform([[not cell for cell in row] for row in solid])
+
+    # a point can sit up to half a cell diagonal away from its cell's centre,
+    # and the wall cell extends another half diagonal towards it
+    margin = math.sqrt(2)
+    self.values = []
+    for y in range(self.height):
+      row = []
+      for x in range(self.width):
+        if solid[y][x]:
+          row.append(-to_space[y][x] * self.cell_size)
+        else:
+          row.append(max(0.0, to_wall[y][x] - margin) * self.cell_size)
+      self.values.append(row)
+
+  def distance_to_wall(self, x, y):
+    cell_x = math.floor(x / self.cell_size) + 1
+    cell_y = math.floor(y / self.cell_size) + 1
+    if cell_x < 0 or cell_x >= self.width or cell_y < 0 or cell_y >= self.height:
+      return -self.cell_size
+    return self.values[cell_y][cell_x]
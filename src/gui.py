@@ -0,0 +1,146 @@
+from collections import OrderedDict
+
+import pygame
+
+class TextCache:
+  """Rendered text surfaces keyed by (text, font, size, colour).
+
+  Fonts are loaded once per (font, size) and rendering only happens on a
+  miss. The least recently used surfaces are dropped once there are more
+  than `max_entries` of them.
+  """
+  def __init__(self, max_entries=256, antialias=False):
+    self.max_entries = max_entries
+    self.antialias = antialias
+    self.fonts = {}
+    self.surfaces = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def font(self, name, size):
+    font = self.fonts.get((name, size))
+    if font is None:
+      # the font module is only started once some text is actually needed
+      if not pygame.font.get_init():
+        pygame.font.init()
+      font = self.fonts[(name, size)] = pygame.font.Font(name, size)
+    return font
+
+  def render(self, text, font, size, color):
+    key = (text, font, size, color)
+    surface = self.surfaces.get(key)
+    if surface is not None:
+      self.surfaces.move_to_end(key)
+      self.hits += 1
+      return surface
+    self.misses += 1
+    surface = self.font(font, size).render(text, self.antialias, color)
+    if pygame.display.get_surface() is not None:
+      surface = surface.convert_alpha() if self.antialias else surface.convert()
+    self.surfaces[key] = surface
+    if len(self.surfaces) > self.max_entries:
+      self.surfaces.popitem(last=False)
+      self.evictions += 1
+    return surface
+
+  def stats(self):
+    return {
+      "entries": len(self.surfaces),
+      "hits": self.hits,
+      "misses": self.misses,
+      "evictions": self.evictions,
+    }
+
+class Gui:
+  """Immediate mode widgets that draw through a RenderQueue.
+
+  Screens call the widget functions every frame after begin(). Every widget
+  keeps its layout (the text surfaces and where they go) under its key,
+  along with the content it was laid out for, so it's only worked out again
+  when that content changes. A frame that looks like the last one is a few
+  dictionary lookups and some queued blits.
+
+  Menus work with the mouse (hover and click) and the keyboard (up/down and
+  enter/space). Keyboard input goes to every menu drawn that frame, so a
+  screen should only have one. `scale` turns window coordinates into the
+  coordinates of the surface the queue is flushed to.
+  """
+  def __init__(self, render_queue, layer, text_cache=None, font=None, scale=1):
+    self.render_queue = render_queue
+    self.layer = layer
+    self.text_cache = text_cache or TextCache()
+    self.font = font
+    self.scale = scale
+    self.layouts = {}
+    self.focus = {}
+    self.mouse = None
+    self.mouse_moved = False
+    self.clicked = False
+    self.moves = 0
+    self.activated = False
+
+  def begin(self, events):
+    self.mouse_moved = False
+    self.clicked = False
+    self.moves = 0
+    self.activated = False
+    for event in events:
+      if event.type == pygame.MOUSEMOTION:
+        self.mouse = (event.pos[0] / self.scale, event.pos[1] / self.scale)
+        self.mouse_moved = True
+      elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+        self.mouse = (event.pos[0] / self.scale, event.pos[1] / self.scale)
+        self.clicked = True
+      elif event.type == pygame.KEYDOWN:
+        if event.key == pygame.K_DOWN:
+          self.moves += 1
+        elif event.key == pygame.K_UP:
+          self.moves -= 1
+        elif event.key in (pygame.K_RETURN, pygame.K_KP_ENTER, pygame.K_SPACE):
+          self.activated = True
+
+  def layout(self, key, content, build):
+    cached = self.layouts.get(key)
+    if cached is None or cached[0] != content:
+      cached = self.layouts[key] = (content, build(*content))
+    return cached[1]
+
+  def layout_label(self, text, position, size, color, anchor):
+    surface = self.text_cache.render(text, self.font, size, color)
+    return surface, surface.get_rect(**{anchor: position}).topleft
+
+  def label(self, text, position, size=16, color=(255, 255, 255), anchor="center", key=None):
+    # text that changes, like a counter, should pass a key so it reuses one layout slot
+    surface, topleft = self.layout(key or text, (text, position, size, color, anchor), self.layout_label)
+    self.render_queue.sprite(self.layer, surface, topleft)
+
+  def layout_menu(self, items, center, size, color, focus_color, spacing):
+    entries = []
+    surfaces = [self.text_cache.render(item, self.font, size, color) for item in items]
+    height = sum(surface.get_height() for surface in surfaces) + spacing * (len(items) - 1)
+    y = center[1] - height // 2
+    for item, surface in zip(items, surfaces):
+      focused = self.text_cache.render(item, self.font, size, focus_color)
+      rect = surface.get_rect(midtop=(center[0], y))
+      entries.append((surface, focused, rect))
+      y += rect.height + spacing
+    return entries
+
+  def menu(self, key, items, center, size=20, color=(120, 120, 120), focus_color=(255, 255, 255), spacing=6):
+    """Draws a vertical list of items, returns the index of the one chosen this frame."""
+    entries = self.layout(key, (tuple(items), center, size, color, focus_color, spacing), self.layout_menu)
+    focus = (self.focus.get(key, 0) + self.moves) % len(entries)
+    chosen = None
+    if self.mouse is not None and (self.mouse_moved or self.clicked):
+      for index, (_, _, rect) in enumerate(entries):
+        if rect.collidepoint(self.mouse):
+          focus = index
+          if self.clicked:
+            chosen = index
+    if self.activated:
+      chosen = focus
+    self.focus[key] = focus
+    for index, (surface, focused, rect) in enumerate(entries):
+      self.render_queue.sprite(self.layer, focused if index == focus else surface, rect.topleft)
+    return chosen
@@ -0,0 +1,76 @@
+from collections import OrderedDict
+
+class LevelManager:
+  """Builds levels ahead of time and keeps the last few around.
+
+  `build(index)` makes level `index` out of `count` levels. Whenever a level
+  is entered, the one after it starts building on a worker thread, so by the
+  time the goal is reached it's usually ready and go_to() only has to swap
+  it in. Levels that were played recently stay in an LRU cache of
+  `cache_size`, so going back to them doesn't rebuild anything.
+
+  The level being left is handed to `release` (level.release() by default),
+  which should give back its surfaces but leave it usable, since it may be
+  entered again from the cache.
+  """
+  def __init__(self, build, count, cache_size=3, release=None):
+    self.build = build
+    self.count = count
+    # the current level and the one being entered both have to fit
+    self.cache_size = max(2, cache_size)
+    self.release = release or (lambda level: level.release())
+    self.executor = None
+    self.cache = OrderedDict()
+    self.pending = {}
+    self.index = None
+    self.current = None
+
+  def has_next(self):
+    return self.index is None or self.index + 1 < self.count
+
+  def prefetch(self, index):
+    if 0 <= index < self.count and index not in self.cache and index not in self.pending:
+      if self.executor is None:
+        # started on first use, concurrent.futures is slow to import for what
+        # it is and the manager is made before the first frame
+        from concurrent.futures import ThreadPoolExecutor
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="level-prefetch")
+      self.pending[index] = self.executor.submit(self.build, index)
+
+  def get(self, index):
+    """Level `index`, from the cache, a finished prefetch, or built right now."""
+    if not 0 <= index < self.count:
+      raise IndexError(index)
+    level = self.cache.get(index)
+    if level is not None:
+      self.cache.move_to_end(index)
+      return level
+    future = self.pending.pop(index, None)
+    level = future.result() if future else self.build(index)
+    self.cache[index] = level
+    while len(self.cache) > self.cache_size:
+      self.cache.popitem(last=False)
+    return level
+
+  def go_to(self, index):
+    level = self.get(index)
+    previous = self.current
+    self.index, self.current = index, level
+    if previous is not None and previous is not level:
+      self.release(previous)
+    self.prefetch(index + 1)
+    return level
+
+  def advance(self):
+    """Enters the next level, or returns None when there are no more."""
+    if not self.has_next():
+      return None
+    return self.go_to(0 if self.index is None else self.index + 1)
+
+  def shutdown(self):
+    if self.executor is not None:
+      self.executor.shutdown(wait=True, cancel_futures=True)
+    self.pending.clear()
+    if self.current is not None:
+      self.release(self.current)
+    self.cache.clear()
@@ -1,81 +1,131 @@
+import time
+# taken before the heavy imports, time to first frame is measured from here
+startup_time = time.perf_counter()
+
 from dataclasses import dataclass
+from functools import cache, partial
 import json
 import math
+import os
 import random
 import pygame
 import sys
 from enum import Enum
 
+from camera import Camera
+from chunks import ChunkedTilemap
+from distance_field import DistanceField
+from gui import Gui
+from level_manager import LevelManager
 from levels import levels
+from quality import QUALITY_TIERS, QualityGovernor
+from render_queue import LAYER_BLOOM, LAYER_ENTITIES, LAYER_LIGHTS, LAYER_PARTICLES, LAYER_TILES, LAYER_UI, RenderQueue
+from surfaces import SurfacePool
 
 DISPLAY_WIDTH = 640
 DISPLAY_HEIGHT = 480
 
+# the world is drawn into a smaller target and upscaled once at the end
+# for the pixelated look, every fill-heavy pass only touches the small target
+RENDER_SCALE = 1.5
+RENDER_WIDTH = int(DISPLAY_WIDTH / RENDER_SCALE)
+RENDER_HEIGHT = int(DISPLAY_HEIGHT / RENDER_SCALE)
+
 TILE_SIZE = 32
+# tiles per side of a tilemap chunk, chunks outside the view aren't drawn
+CHUNK_SIZE = 8
 FPS = 60
+# longest the loop sleeps on a static screen before checking in again, in ms
+IDLE_TIMEOUT = 500
+# F12 starts and stops recording the display into recordings/, either as a
+# "png" frame sequence or a single "raw" video file
+CAPTURE_FORMAT = "png"
+
+LIGHT_SPEED = 100
+# how far light reaches, lights further than this from the view are culled
+MAX_RAY_LENGTH = 998
+# distance field cells per tile, used to skip through open space when casting rays
+DISTANCE_FIELD_RESOLUTION = 4
 
-RAY_STEPS = [c * 2 for c in range(0, 500)]
+# ray counts, noise and bloom drop a tier when frames run over budget
+quality_governor = QualityGovernor(QUALITY_TIERS, frame_budget=1000 / FPS)
 
-world = pygame.Surface((DISPLAY_WIDTH, DISPLAY_HEIGHT), pygame.SRCALPHA)
 camera_shake = 0
 camera_shake_decay = 0.9
 slowdown = 1
 
+@cache
+def ray_directions(num_rays):
+  # cos/sin of evenly spaced ray angles, shared by every light with this many rays
+  angles = [((2 * math.pi) / num_rays) * i for i in range(num_rays)]
+  return tuple(zip([math.cos(angle) for angle in angles], [math.sin(angle) for angle in angles]))
+
 class Light:
-  def __init__(self, tilemap, x, y, patrol_route, num_rays=256):
+  __slots__ = (
+    "tilemap", "distance_field", "num_rays", "intersections", "patrol_path", "patrol_time",
+    "x", "y", "current_patrol_route_index", "triangles", "visible", "time",
+    "light_surface", "noise_surface", "bloom_surface",
+  )
+
+  def __init__(self, tilemap, distance_field, patrol_path, num_rays=QUALITY_TIERS[-1].num_rays):
     self.tilemap = tilemap
-    self.x = x
-    self.y = y
+    self.distance_field = distance_field
     self.num_rays = num_rays
     self.intersections = []
-    self.patrol_route = patrol_route
-    self.current_patrol_route_index = 1
-    self.speed = 100
+    self.patrol_path = patrol_path
+    self.seek(0)
     self.triangles = []
-    self.rays = self.init_rays()
+    self.visible = True
     self.time = 0
-    self.light_surface = pygame.Surface((DISPLAY_WIDTH, DISPLAY_HEIGHT), pygame.SRCALPHA)
-    self.noise_surface = pygame.Surface((DISPLAY_WIDTH, DISPLAY_HEIGHT), pygame.SRCALPHA)
-    self.bloom_surface = pygame.Surface((DISPLAY_WIDTH, DISPLAY_HEIGHT), pygame.SRCALPHA)
-
-  def init_rays(self):
-    rays = []
-    for i in range(0, self.num_rays):
-      angle = ((2 * math.pi) / self.num_rays) * i
-      rays.append(Ray(self.tilemap, self.x, self.y, angle))
-    return rays
-
-  def update_rays(self):
-    for i, ray in enumerate(self.rays):
-      angle = ((2 * math.pi) / self.num_rays) * i
-      self.rays[i].x = self.x
-      self.rays[i].y = self.y
-      self.rays[i].angle = angle
+    # render targets are only taken from the pool once the light is first drawn,
+    # lights that never come into view never get any
+    self.light_surface = None
+    self.noise_surface = None
+    self.bloom_surface = None
+
+  def acquire_surfaces(self):
+    self.light_surface = surface_pool.acquire((RENDER_WIDTH, RENDER_HEIGHT), alpha=True)
+    self.noise_surface = surface_pool.acquire((RENDER_WIDTH, RENDER_HEIGHT), alpha=True)
+    self.bloom_surface = surface_pool.acquire((RENDER_WIDTH, RENDER_HEIGHT), alpha=True)
+
+  def release(self):
+    if self.light_surface is None:
+      return
+    surface_pool.release(self.light_surface)
+    surface_pool.release(self.noise_surface)
+    surface_pool.release(self.bloom_surface)
+    self.light_surface = self.noise_surface = self.bloom_surface = None
+
+  def set_num_rays(self, num_rays):
+    self.num_rays = num_rays
+
+  def seek(self, patrol_time):
+    self.patrol_time = patrol_time
+    self.x, self.y, self.current_patrol_route_index = self.patrol_path.position_at(patrol_time)
 
   def patrol(self, dt):
-    target_tile = self.patrol_route[self.current_patrol_route_index]
-    target_point = compute_middle_of_tile_in_pixels(*target_tile)
-    x_distance = target_point[0] - self.x
-    y_distance = target_point[1] - self.y
-    angle = math.atan2(y_distance, x_distance)
-    dx = math.cos(angle) * self.speed
-    dy = math.sin(angle) * self.speed
-    self.x += dx * dt
-    self.y += dy * dt
-    if math.sqrt((x_distance ** 2) + (y_distance ** 2)) < 5:
-      self.current_patrol_route_index += 1
-      self.current_patrol_route_index %= len(self.patrol_route)
+    self.seek(self.patrol_time + dt)
 
-  def update(self, dt):
+  def influence_rect(self):
+    return pygame.Rect(self.x - MAX_RAY_LENGTH, self.y - MAX_RAY_LENGTH, MAX_RAY_LENGTH * 2, MAX_RAY_LENGTH * 2)
+
+  def update(self, dt, view_rect):
     self.time += dt * 0.5
-    self.update_rays()
-    self.intersections = []
-    for ray in self.rays:
-      intersection = ray.compute_level_intersection_point()
-      self.intersections.append(intersection)
+    # only lights that can reach into the view need their rays cast
+    self.visible = self.influence_rect().colliderect(view_rect)
+    if self.visible:
+      self.intersections.clear()
+      ray_step = quality_governor.tier.ray_step
+      for co, si in ray_directions(self.num_rays):
+        self.intersections.append(cast_ray(self.tilemap, self.distance_field, self.x, self.y, co, si, ray_step))
+    else:
+      self.intersections.clear()
+      self.triangles.clear()
     self.patrol(dt)
 
   def render_visibility_polygon(self):
+    if self.light_surface is None:
+      self.acquire_surfaces()
     self.triangles = []
     self.light_surface.fill((0, 0, 0, 0))
     light_brightness = int(180 + math.sin(self.time * 3) * 40)
@@ -83,11 +133,12 @@ class Light:
       next_intersection = self.intersections[(index + 1) % len(self.intersections)]
       triangle = [(self.x, self.y), (intersection[0], intersection[1]), (next_intersection[0], next_intersection[1])]
       self.triangles.append(triangle)
-      pygame.draw.polygon(self.light_surface, (255, 0, 0, light_brightness), triangle)
+      screen_triangle = [camera.to_screen(*point) for point in triangle]
+      pygame.draw.polygon(self.light_surface, (255, 0, 0, light_brightness), screen_triangle)
     self.create_noise()
     self.light_surface.blit(self.noise_surface, (0, 0), special_flags = pygame.BLEND_ADD)
     self.render_bloom(light_brightness)
-    world.blit(self.light_surface, (0, 0))
+    render_queue.sprite(LAYER_LIGHTS, self.light_surface, (0, 0))
 
   # TODO implement bloom myself again so I know what's going on here
   def render_bloom(self, intensity):
@@ -101,35 +152,45 @@ class Light:
     )
 
     # Strong blur
-    small = pygame.transform.smoothscale(
+    bloom_downscale = quality_governor.tier.bloom_downscale
+    small = surface_pool.acquire((DISPLAY_WIDTH // bloom_downscale, DISPLAY_HEIGHT // bloom_downscale), alpha=True)
+    blurred = surface_pool.acquire((RENDER_WIDTH, RENDER_HEIGHT), alpha=True)
+    pygame.transform.smoothscale(
         self.bloom_surface,
-        (DISPLAY_WIDTH // 15, DISPLAY_HEIGHT // 15)
+        small.get_size(),
+        small
     )
-    blurred = pygame.transform.smoothscale(
+    pygame.transform.smoothscale(
         small,
-        (DISPLAY_WIDTH, DISPLAY_HEIGHT)
+        blurred.get_size(),
+        blurred
     )
 
     # Additive blend ONLY
-    world.blit(blurred, (0, 0), special_flags=pygame.BLEND_ADD)
+    render_queue.sprite(LAYER_BLOOM, blurred, (0, 0), blend=pygame.BLEND_ADD)
+    surface_pool.release(small)
+    render_queue.after_flush(surface_pool.release, blurred)
 
   def create_noise(self):
     self.noise_surface.fill((0, 0, 0, 0))
-    for _ in range(2500):
-      x = random.randint(0, DISPLAY_WIDTH)
-      y = random.randint(0, DISPLAY_HEIGHT)
+    # same density of noise per world pixel at any render scale
+    for _ in range(int(quality_governor.tier.noise_points / RENDER_SCALE ** 2)):
+      x = random.randint(0, RENDER_WIDTH)
+      y = random.randint(0, RENDER_HEIGHT)
       alpha = random.randint(20, 50)
       self.noise_surface.set_at((x, y), (255, 100, 0, alpha))
 
   def render(self):
+    if not self.visible:
+      return
     self.render_visibility_polygon()
-    pygame.draw.circle(world, (255, 255, 0), (self.x, self.y), 10)
+    render_queue.circle(LAYER_LIGHTS, (255, 255, 0), camera.to_screen(self.x, self.y), 10 * camera.zoom)
 
 def compute_middle_of_tile_in_pixels(tile_x, tile_y):
   return (tile_x * TILE_SIZE) + (TILE_SIZE // 2), (tile_y * TILE_SIZE) + (TILE_SIZE // 2)
 
 def point_inside_block(level, x, y):
-  if x < 0 or x > DISPLAY_WIDTH or y < 0 or y > DISPLAY_HEIGHT:
+  if x < 0 or x >= len(level[0]) * TILE_SIZE or y < 0 or y >= len(level) * TILE_SIZE:
     return True
   level_x = int(x // TILE_SIZE)
   level_y = int(y // TILE_SIZE)
@@ -182,6 +243,8 @@ def is_inside(point, polygon):
   return True
 
 class Goal:
+  __slots__ = ("w", "h", "x", "y")
+
   def __init__(self, tile_x, tile_y):
     self.w = 10
     self.h = 10
@@ -193,37 +256,29 @@ class Goal:
     pass
 
   def render(self):
-    pygame.draw.rect(world, (0, 255, 0), (self.x, self.y, self.w, self.h))
+    render_queue.rect(LAYER_ENTITIES, (0, 255, 0), (*camera.to_screen(self.x, self.y), self.w * camera.zoom, self.h * camera.zoom))
 
   def set_tile_position(self, tile_x, tile_y):
     self.x, self.y = compute_middle_of_tile_in_pixels(tile_x, tile_y)
     self.x -= self.w // 2
     self.y -= self.h // 2
 
-class Ray:
-  def __init__(self, tilemap, x, y, angle):
-    self.tilemap = tilemap
-    self.x = x
-    self.y = y
-    self.angle = self.normalise_angle(angle)
-
-  def normalise_angle(self, angle):
-    angle = angle % (2 * math.pi)
-    if angle < 0:
-      angle = (2 * math.pi) + angle
-    return angle
-
-  def compute_level_intersection_point(self):
-    x = 0
-    y = 0
-    co = math.cos(self.angle)
-    si = math.sin(self.angle)
-    for c in RAY_STEPS:
-      x = self.x + c * co
-      y = self.y + c * si
-      if point_inside_block(self.tilemap, x, y):
-        break
-    return x, y
+def cast_ray(tilemap, distance_field, origin_x, origin_y, co, si, ray_step):
+  x = 0
+  y = 0
+  c = 0
+  while True:
+    x = origin_x + c * co
+    y = origin_y + c * si
+    # sphere trace: everything within safe_distance is open space, so jump
+    # ahead over those steps and only test tiles once we're close to a wall
+    safe_distance = distance_field.distance_to_wall(x, y)
+    if safe_distance < ray_step and point_inside_block(tilemap, x, y):
+      break
+    if c >= MAX_RAY_LENGTH:
+      break
+    c = min(c + max(ray_step, int(safe_distance // ray_step) * ray_step), MAX_RAY_LENGTH)
+  return x, y
 
 particles = []
 
@@ -231,7 +286,12 @@ class RunParticle:
   PARTICLE_WIDTH = 7
   PARTICLE_HEIGHT = 7
   DECAY_FACTOR = 3
+  __slots__ = ("x", "y", "w", "h", "alive", "decay_factor", "lifetime", "starting_rotation")
+
   def __init__(self, x, y):
+    self.reset(x, y)
+
+  def reset(self, x, y):
     self.x = x
     self.y = y
     self.w = self.PARTICLE_WIDTH
@@ -249,13 +309,35 @@ class RunParticle:
       self.alive = False
 
   def render(self):
-    rect_surf = pygame.Surface((math.floor(self.w), math.floor(self.h)), pygame.SRCALPHA)
+    rect_surf = surface_pool.acquire((math.floor(self.w * camera.zoom), math.floor(self.h * camera.zoom)), alpha=True)
     pygame.draw.rect(rect_surf, (78, 78, 78), rect_surf.get_rect())
     rotated_surface = pygame.transform.rotate(rect_surf, (self.starting_rotation + self.lifetime)*180)
-    rotated_surface_rect = rotated_surface.get_rect(center=(self.x, self.y))
-    world.blit(rotated_surface, rotated_surface_rect)
+    rotated_surface_rect = rotated_surface.get_rect(center=camera.to_screen(self.x, self.y))
+    render_queue.sprite(LAYER_PARTICLES, rotated_surface, rotated_surface_rect.topleft)
+    surface_pool.release(rect_surf)
+
+# dead particles are parked here and handed out again by spawn_particle
+particle_pool = []
+
+def spawn_particle(x, y):
+  if particle_pool:
+    particle = particle_pool.pop()
+    particle.reset(x, y)
+  else:
+    particle = RunParticle(x, y)
+  particles.append(particle)
+  return particle
+
+def clear_particles():
+  particle_pool.extend(particles)
+  particles.clear()
 
 class Player:
+  __slots__ = (
+    "tilemap", "w", "h", "x", "y", "dx", "dy", "speed", "gravity", "gravity_cut", "jump_velocity",
+    "on_ground", "jump_timer", "max_jump_timer", "squish_factor", "particle_timer", "particle_spawn_time",
+  )
+
   def __init__(self, tilemap, x, y):
     self.tilemap = tilemap
     self.w = 10
@@ -316,7 +398,7 @@ class Player:
             self.particle_timer -= dt
           else:
             self.particle_timer = self.particle_spawn_time
-            particles.append(RunParticle(self.x, self.y + self.h))
+            spawn_particle(self.x, self.y + self.h)
     elif self.dx < 0:
       if point_inside_block(self.tilemap, left, top + 1) or point_inside_block(self.tilemap, left, bottom - 1):
         tile_x = int(left // TILE_SIZE) + 1
@@ -328,7 +410,7 @@ class Player:
             self.particle_timer -= dt
           else:
             self.particle_timer = self.particle_spawn_time
-            particles.append(RunParticle(self.x + self.w, self.y + self.h))
+            spawn_particle(self.x + self.w, self.y + self.h)
     else:
       self.particle_timer = 0
     
@@ -368,35 +450,105 @@ class Player:
     )
 
   def render(self):
-    pygame.draw.rect(world, (0, 255, 255), (self.x - self.squish_factor // 2, self.y + self.squish_factor, self.w + self.squish_factor, self.h - self.squish_factor))
+    x, y = camera.to_screen(self.x - self.squish_factor // 2, self.y + self.squish_factor)
+    w = (self.w + self.squish_factor) * camera.zoom
+    h = (self.h - self.squish_factor) * camera.zoom
+    render_queue.rect(LAYER_ENTITIES, (0, 255, 255), (x, y, w, h))
   
-pygame.init()
+# only the display (which brings keyboard and events with it) is needed to get
+# going, audio, joystick and the rest of SDL are never started
+pygame.display.init()
 display = pygame.display.set_mode((DISPLAY_WIDTH, DISPLAY_HEIGHT))
+surface_pool = SurfacePool()
+# world is always filled black before drawing, so it doesn't need alpha
+world = surface_pool.acquire((RENDER_WIDTH, RENDER_HEIGHT))
+camera = Camera(DISPLAY_WIDTH, DISPLAY_HEIGHT, zoom=1 / RENDER_SCALE)
+# entities queue their draws during the frame, they're drawn into world in one go
+render_queue = RenderQueue()
+# menus and text are laid out in world pixels, the mouse comes in display pixels
+gui = Gui(render_queue, LAYER_UI, scale=RENDER_SCALE)
 is_game_running = True
 clock = pygame.Clock()
+frame_capture = None
 
-def draw_tilemap(tilemap):
-  for row_index, row in enumerate(tilemap):
-    for column_index, entry in enumerate(row):
-      if not entry:
-        continue
-      x = column_index * TILE_SIZE
-      y = row_index * TILE_SIZE
-      rect = pygame.Rect(x, y, TILE_SIZE, TILE_SIZE)
-      pygame.draw.rect(world, (255, 255, 255), rect, 2)
+def draw_tilemap(chunks):
+  view_rect = camera.view_rect()
+  for chunk in chunks.chunks_in_rect(view_rect):
+    x, y = camera.to_screen(chunk.x, chunk.y)
+    render_queue.sprite(LAYER_TILES, chunk.surface, (round(x), round(y)))
 
 @dataclass
 class Level:
   tilemap: list[list[int]]
+  chunks: ChunkedTilemap
+  distance_field: DistanceField
   lights: list[Light]
   player: Player
   goal: Goal
+  initial_state: tuple = None
+  history: "RewindBuffer" = None
+
+  def __post_init__(self):
+    from rewind import RewindBuffer
+    self.initial_state = self.snapshot()
+    self.history = RewindBuffer(len(self.lights))
+
+  def snapshot(self):
+    player = self.player
+    return (
+      (player.x, player.y, player.dx, player.dy, player.on_ground,
+       player.jump_timer, player.squish_factor, player.particle_timer),
+      tuple((light.patrol_time, light.time) for light in self.lights),
+    )
+
+  def restore(self, state):
+    player = self.player
+    (player.x, player.y, player.dx, player.dy, player.on_ground,
+     player.jump_timer, player.squish_factor, player.particle_timer) = state[0]
+    for light, light_state in zip(self.lights, state[1]):
+      patrol_time, light.time = light_state
+      light.seek(patrol_time)
+      light.intersections.clear()
+      light.triangles.clear()
+
+  def reset(self):
+    # restart in place instead of rebuilding lights, rays and surfaces
+    self.restore(self.initial_state)
+    self.history.clear()
+    clear_particles()
+
+  def record(self):
+    self.history.record(self.player, self.lights, particles)
+
+  def rewind(self):
+    frame = self.history.rewind()
+    if frame is None:
+      return
+    self.restore(frame.level_state)
+    clear_particles()
+    for x, y, lifetime, starting_rotation in frame.particles:
+      particle = spawn_particle(x, y)
+      particle.lifetime = lifetime
+      particle.w -= particle.decay_factor * lifetime
+      particle.h -= particle.decay_factor * lifetime
+      particle.starting_rotation = starting_rotation
+
+  def release(self):
+    self.chunks.release()
+    for light in self.lights:
+      light.release()
 
 current_level_index = 0
 
 def load_level(levels, current_level_index):
+  # patrol and rewind need numpy, which takes longer to import than everything
+  # else up to the first frame, so they're only imported once a level is
+  # built, on the level worker
+  from patrol import PatrolPath
   current_level_data = levels[current_level_index]
   tilemap = current_level_data["tilemap"]
+  chunks = ChunkedTilemap(tilemap, TILE_SIZE, surface_pool, CHUNK_SIZE, scale=camera.zoom)
+  distance_field = DistanceField(tilemap, TILE_SIZE, DISTANCE_FIELD_RESOLUTION)
   player_start_pos = current_level_data["player_start_pos"]
   player = Player(tilemap, *compute_middle_of_tile_in_pixels(*player_start_pos))
   goal_pos = current_level_data["goal_pos"]
@@ -404,15 +556,26 @@ def load_level(levels, current_level_index):
   lights = []
   for light in current_level_data["lights"]:
     start_pos = light["start_pos"]
-    patrol_route = [tuple(patrol_point) for patrol_point in light["patrol_route"]]
-    lights.append(Light(tilemap, *compute_middle_of_tile_in_pixels(start_pos[0], start_pos[1]), patrol_route))
-  level = Level(tilemap, lights, player, goal)
+    patrol_route = [compute_middle_of_tile_in_pixels(*patrol_point) for patrol_point in light["patrol_route"]]
+    patrol_path = PatrolPath(compute_middle_of_tile_in_pixels(*start_pos), patrol_route, LIGHT_SPEED)
+    lights.append(Light(tilemap, distance_field, patrol_path, quality_governor.tier.num_rays))
+  level = Level(tilemap, chunks, distance_field, lights, player, goal)
   #level_json_loading_time = os.path.getmtime("./src/levels.json")
-  global particles 
-  particles = []
   return level
 
-current_level = load_level(levels, current_level_index)
+def start_level(level):
+  # prefetched and cached levels can be from a different quality tier
+  for light in level.lights:
+    light.set_num_rays(quality_governor.tier.num_rays)
+  level.reset()
+  return level
+
+# levels are built on a worker thread ahead of time, the first one while the
+# title screen is up. A level that's left may already have chunks and lights
+# queued for this frame, so its surfaces only go back to the pool once the
+# queue has been flushed
+level_manager = LevelManager(partial(load_level, levels), len(levels),
+                             release=lambda level: render_queue.after_flush(level.release))
 level_json_loading_time = 0
 
 class game_states(Enum):
@@ -422,14 +585,80 @@ class game_states(Enum):
   goal_state = 3
   finish_state = 4
 
-current_game_state = game_states.play_state
+# screens that only change on input
+STATIC_STATES = (game_states.title_state, game_states.goal_state, game_states.finish_state)
+
+current_game_state = game_states.title_state
+
+# optional procedural background rendered on its own thread behind the tilemap,
+# any of the raymarch ProceduralBG variants can be plugged in here
+USE_BACKGROUND_LAYER = False
+background_layer = None
+if USE_BACKGROUND_LAYER:
+  # imported here so numpy isn't loaded before the first frame
+  from background import BackgroundLayer
+  from raymarch3 import ProceduralBG
+  background_layer = BackgroundLayer(ProceduralBG(DISPLAY_WIDTH, DISPLAY_HEIGHT, scale=4), fps=30)
+  background_layer.start()
+
+# the scanline overlay never changes, so it's built once and blitted every frame
+scanline_surface = surface_pool.acquire((RENDER_WIDTH, RENDER_HEIGHT), alpha=True)
+scanline_surface.fill((0, 0, 0, 0))
+for y in range(0, DISPLAY_HEIGHT, 4):
+  render_y = int(y / RENDER_SCALE)
+  pygame.draw.line(scanline_surface, (0, 0, 0, 60), (0, render_y), (RENDER_WIDTH, render_y))
+
+def apply_quality(change):
+  print(f"quality: {change.previous.name} -> {change.tier.name} ({change.average_frame_time:.1f} ms/frame)")
+  if current_level:
+    for light in current_level.lights:
+      light.set_num_rays(change.tier.num_rays)
+
+quality_governor.on_change(apply_quality)
 
 def display_death_text():
-  ...
+  gui.label("caught", (RENDER_WIDTH // 2, RENDER_HEIGHT // 3), size=40)
+  gui.label("r to retry, hold backspace to rewind", (RENDER_WIDTH // 2, RENDER_HEIGHT // 3 + 30), color=(200, 200, 200))
+
+def toggle_capture():
+  global frame_capture
+  if frame_capture:
+    frame_capture.stop()
+    print(f"capture: stopped, {frame_capture.stats()}")
+    frame_capture = None
+    return
+  name = time.strftime("%Y%m%d-%H%M%S")
+  path = os.path.join("recordings", name if CAPTURE_FORMAT == "png" else f"{name}.raw")
+  from capture import FrameCapture
+  frame_capture = FrameCapture(path, CAPTURE_FORMAT)
+  frame_capture.start(display)
+  print(f"capture: recording {frame_capture.size[0]}x{frame_capture.size[1]} {frame_capture.pixel_format} to {path}")
+
+# no level until the title screen is left
+current_level = None
+startup_reported = False
+idle = False
 
 while is_game_running:
+  if idle:
+    # the last frame is still on screen and nothing will change it until
+    # something happens, so sleep on the event queue instead of redrawing it
+    event = pygame.event.wait(IDLE_TIMEOUT)
+    # restart the frame timer so the wait doesn't count as a slow frame
+    clock.tick()
+    if event.type == pygame.NOEVENT:
+      continue
+    # hand it back to the normal event handling and run at full rate again
+    pygame.event.post(event)
+    idle = False
+
   world.fill((0, 0, 0))
-  dt = clock.tick(FPS) * slowdown / 1000
+  if background_layer:
+    background_layer.render(world)
+  # the first frame goes out straight away instead of waiting out the frame cap
+  dt = clock.tick(FPS if startup_reported else 0) * slowdown / 1000
+  # time spent on the last frame, not counting the wait for the next tick
+  quality_governor.record(clock.get_rawtime())
   dt = min(dt, 0.033)
 
   #if os.path.getmtime("./src/levels.json") != level_json_loading_time:
@@ -442,18 +671,52 @@ while is_game_running:
   keys = pygame.key.get_pressed()
   if keys[pygame.K_ESCAPE]:
     is_game_running = False
-  for event in pygame.event.get():
+  events = pygame.event.get()
+  gui.begin(events)
+  for event in events:
     if event.type == pygame.QUIT:
       is_game_running = False
+    if event.type == pygame.KEYDOWN and event.key == pygame.K_F12:
+      toggle_capture()
+    # page up/down to jump between levels, recently played ones are cached
+    if current_level and event.type == pygame.KEYDOWN and event.key in (pygame.K_PAGEUP, pygame.K_PAGEDOWN):
+      index = level_manager.index + (1 if event.key == pygame.K_PAGEDOWN else -1)
+      if 0 <= index < level_manager.count:
+        current_level = start_level(level_manager.go_to(index))
+        current_game_state = game_states.play_state
+        slowdown = 1
+
+  # hold backspace to step back through the recorded history
+  in_level = current_game_state in (game_states.play_state, game_states.dead_state)
+  rewinding = in_level and keys[pygame.K_BACKSPACE] and len(current_level.history) > 1
+  if rewinding:
+    current_level.rewind()
+    current_game_state = game_states.play_state
+    slowdown = 1
+    dt = 0
+
+  # a menu screen with no input and nothing animating is drawn without the
+  # random glitches, so it's a clean frame to leave up while idle
+  static = (current_game_state in STATIC_STATES and not events and camera_shake <= 0.1 and
+            background_layer is None and frame_capture is None)
 
-  if not current_game_state == game_states.title_state:
-    draw_tilemap(current_level.tilemap)
   if current_game_state == game_states.title_state:
-    # TODO add title screen with immediate mode GUI
-    pass
+    gui.label("changing paths", (RENDER_WIDTH // 2, RENDER_HEIGHT // 3), size=48, color=(255, 0, 0))
+    choice = gui.menu("title", ("play", "quit"), (RENDER_WIDTH // 2, RENDER_HEIGHT * 2 // 3))
+    if choice == 0:
+      # the first level has been building since the title screen came up
+      current_level = start_level(level_manager.go_to(current_level_index))
+      current_game_state = game_states.play_state
+    elif choice == 1:
+      is_game_running = False
+
+  if not current_game_state == game_states.title_state:
+    player = current_level.player
+    camera.follow(player.x + player.w / 2, player.y + player.h / 2, current_level.chunks.pixel_width, current_level.chunks.pixel_height)
+    draw_tilemap(current_level.chunks)
   if current_game_state == game_states.play_state:
     for light in current_level.lights:
-      light.update(dt)
+      light.update(dt, camera.view_rect())
     current_level.player.update(dt)
 
     for light in current_level.lights:
@@ -479,21 +742,26 @@ while is_game_running:
 
     for particle in dead_particles:
       particles.remove(particle)
+      particle_pool.append(particle)
+
+    if not rewinding:
+      current_level.record()
 
     player_rect = pygame.Rect(current_level.player.x, current_level.player. y, current_level.player.w, current_level.player.h)
     goal_rect = pygame.Rect(current_level.goal.x, current_level.goal.y, current_level.goal.w, current_level.goal.h)
     if player_rect.colliderect(goal_rect):
-      current_level_index += 1
       slowdown = 1
-      current_level = load_level(levels, current_level_index)
-      #current_game_state = game_states.goal_state
-      # TODO add check for whether we are done with all levels
-      # TODO if so, display finish logo
+      if level_manager.has_next():
+        current_game_state = game_states.goal_state
+      else:
+        current_game_state = game_states.finish_state
       print("booya")
 
+    gui.label(f"level {level_manager.index + 1}/{level_manager.count}", (6, 6), anchor="topleft", key="hud level")
+
   if current_game_state == game_states.dead_state:
     for light in current_level.lights:
-      light.update(dt)
+      light.update(dt, camera.view_rect())
     for light in current_level.lights:
       light.render()
     current_level.goal.render()
@@ -509,19 +777,36 @@ while is_game_running:
 
     for particle in dead_particles:
       particles.remove(particle)
+      particle_pool.append(particle)
+
+    display_death_text()
+
+  if current_game_state == game_states.goal_state:
+    gui.label("level cleared", (RENDER_WIDTH // 2, RENDER_HEIGHT // 3), size=40, color=(0, 255, 0))
+    if gui.menu("goal", ("next level",), (RENDER_WIDTH // 2, RENDER_HEIGHT * 2 // 3)) == 0:
+      # the next level has been building since this one started, so this is
+      # normally just a swap
+      current_level = start_level(level_manager.advance())
+      current_game_state = game_states.play_state
+
+  if current_game_state == game_states.finish_state:
+    gui.label("you made it out", (RENDER_WIDTH // 2, RENDER_HEIGHT // 3), size=40, color=(0, 255, 255))
+    choice = gui.menu("finish", ("play again", "quit"), (RENDER_WIDTH // 2, RENDER_HEIGHT * 2 // 3))
+    if choice == 0:
+      current_level = start_level(level_manager.go_to(0))
+      current_game_state = game_states.play_state
+    elif choice == 1:
+      is_game_running = False
 
-  if keys[pygame.K_r]:
-    current_level = load_level(levels, current_level_index)
+  if in_level and keys[pygame.K_r]:
+    current_level.reset()
     slowdown = 1
-    particles = []
     current_game_state = game_states.play_state
 
+  render_queue.flush(world)
+
   # all these postprocessing effects are from https://dev.to/chrisgreening/simulating-simple-crt-and-glitch-effects-in-pygame-1mf1
   # add scanlines
-  scanline_surface = pygame.Surface((DISPLAY_WIDTH, DISPLAY_HEIGHT), pygame.SRCALPHA)
-  for y in range(0, DISPLAY_HEIGHT, 4):
-    pygame.draw.line(scanline_surface, (0, 0, 0, 60), (0, y), (DISPLAY_WIDTH, y))
-
   world.blit(scanline_surface, (0, 0))
 
   # apply flicker - commented out because this doesn't look so good
@@ -536,18 +821,18 @@ while is_game_running:
   #glow_surf.set_alpha(100)
   #world.blit(glow_surf, (0, 0))
 
-  glitch_surface = world.copy()
-  if random.random() < 0.1:
-    shift_amount = 30
-    y_start = random.randint(0, DISPLAY_HEIGHT - 20)
-    slice_height = random.randint(5, 20)
+  # only the shifted slice is copied, the rest of the frame stays as it is
+  if not static and random.random() < 0.1:
+    shift_amount = int(30 / RENDER_SCALE)
+    y_start = random.randint(0, RENDER_HEIGHT - int(20 / RENDER_SCALE))
+    slice_height = random.randint(int(5 / RENDER_SCALE), int(20 / RENDER_SCALE))
     offset = random.randint(-shift_amount, shift_amount)
 
-    slice_area = pygame.Rect(0, y_start, DISPLAY_WIDTH, slice_height)
-    slice_copy = glitch_surface.subsurface(slice_area).copy()
-    glitch_surface.blit(slice_copy, (offset, y_start))
-
-  world.blit(glitch_surface, (0, 0))
+    slice_area = pygame.Rect(0, y_start, RENDER_WIDTH, slice_height)
+    slice_copy = surface_pool.acquire(slice_area.size)
+    slice_copy.blit(world, (0, 0), slice_area)
+    world.blit(slice_copy, (offset, y_start))
+    surface_pool.release(slice_copy)
   
 
   # chromatic aberration/RGB shift effect
@@ -558,23 +843,28 @@ while is_game_running:
   # only red pixels survive at original strength)
   # then combine with a slight offset
   # RED channel
-  if random.random() < 0.02:
+  if not static and random.random() < 0.02:
     shift = random.randint(1, 3)
-    rgb = world.copy()
+    rgb = surface_pool.acquire(world.get_size())
+    rgb.blit(world, (0, 0))
+    channel = surface_pool.acquire(world.get_size())
 
-    red = rgb.copy()
-    red.fill((255, 0, 0), special_flags=pygame.BLEND_MULT)
-    world.blit(red, (-shift, 0), special_flags=pygame.BLEND_ADD)
+    channel.blit(rgb, (0, 0))
+    channel.fill((255, 0, 0), special_flags=pygame.BLEND_MULT)
+    world.blit(channel, (-shift, 0), special_flags=pygame.BLEND_ADD)
 
     # GREEN channel
-    green = rgb.copy()
-    green.fill((0, 255, 0), special_flags=pygame.BLEND_MULT)
-    world.blit(green, (0, 0), special_flags=pygame.BLEND_ADD)
+    channel.blit(rgb, (0, 0))
+    channel.fill((0, 255, 0), special_flags=pygame.BLEND_MULT)
+    world.blit(channel, (0, 0), special_flags=pygame.BLEND_ADD)
 
     # BLUE channel
-    blue = rgb.copy()
-    blue.fill((0, 0, 255), special_flags=pygame.BLEND_MULT)
-    world.blit(blue, (shift, 2), special_flags=pygame.BLEND_ADD)
+    channel.blit(rgb, (0, 0))
+    channel.fill((0, 0, 255), special_flags=pygame.BLEND_MULT)
+    world.blit(channel, (shift, 2), special_flags=pygame.BLEND_ADD)
+
+    surface_pool.release(rgb)
+    surface_pool.release(channel)
 
   camera_x_offset, camera_y_offset = 0, 0
   if camera_shake > 0.1:
@@ -585,14 +875,30 @@ while is_game_running:
   if slowdown < 1:
     slowdown = min(slowdown + dt, 1)
 
-  # pixelate - commented out for now because this has to be done last, so affects final
-  # call to blitting of the world surface, but just keeping this in here to maybe apply later
-  small_surf = pygame.transform.scale(world, (DISPLAY_WIDTH // 1.5, DISPLAY_HEIGHT // 1.5))
-  display.blit(pygame.transform.scale(small_surf, (DISPLAY_WIDTH, DISPLAY_HEIGHT)), (camera_x_offset, camera_y_offset))
+  # pixelate - the world is already drawn at RENDER_SCALE, so a single nearest
+  # neighbour upscale straight into the display gives the blocky look
+  pygame.transform.scale(world, display.get_size(), display)
+  if camera_x_offset or camera_y_offset:
+    display.scroll(camera_x_offset, camera_y_offset)
 
   #display.blit(world, (camera_x_offset, camera_y_offset))
 
+  if frame_capture:
+    frame_capture.capture(display)
   pygame.display.flip()
 
+  if not startup_reported:
+    startup_reported = True
+    print(f"startup: first frame {(time.perf_counter() - startup_time) * 1000:.0f} ms")
+    # start on the first level only now, so building it doesn't hold up the title screen
+    level_manager.prefetch(current_level_index)
+
+  idle = static and current_game_state in STATIC_STATES
+
+if background_layer:
+  background_layer.stop()
+if frame_capture:
+  toggle_capture()
+level_manager.shutdown()
 pygame.quit()
 sys.exit(0)
\ No newline at end of file
@@ -0,0 +1,81 @@
+import bisect
+import math
+
+import numpy as np
+
+class PatrolPath:
+  """A patrol route compiled into an arc-length table.
+
+  Like the old incremental patrol, the light first heads from `start` to
+  waypoint 1, then loops through the remaining waypoints and back round
+  through waypoint 0 forever. The position at any time is a binary search
+  into the cumulative segment lengths plus a linear interpolation, so it
+  doesn't depend on the step size and lands on every waypoint exactly.
+  """
+  def __init__(self, start, waypoints, speed):
+    self.speed = speed
+    self.num_waypoints = len(waypoints)
+    self.start = start
+    first = waypoints[1 % len(waypoints)]
+    self.lead_in = math.dist(start, first)
+    # loop[k] is waypoint (k + 1) % n, closed back onto the first target
+    self.loop = [waypoints[(k + 1) % len(waypoints)] for k in range(len(waypoints) + 1)]
+    self.lengths = [0.0]
+    for a, b in zip(self.loop, self.loop[1:]):
+      self.lengths.append(self.lengths[-1] + math.dist(a, b))
+    self.loop_length = self.lengths[-1]
+    self.xs = np.array([point[0] for point in self.loop], dtype=float)
+    self.ys = np.array([point[1] for point in self.loop], dtype=float)
+    self.cumulative = np.array(self.lengths)
+
+  def position_at(self, time):
+    """Returns (x, y, index of the waypoint being headed to) at `time`."""
+    distance = time * self.speed
+    if distance < self.lead_in:
+      first = self.loop[0]
+      f = distance / self.lead_in
+      return (self.start[0] + (first[0] - self.start[0]) * f,
+              self.start[1] + (first[1] - self.start[1]) * f,
+              1 % self.num_waypoints)
+    if self.loop_length == 0:
+      return self.loop[0][0], self.loop[0][1], 1 % self.num_waypoints
+    distance = (distance - self.lead_in) % self.loop_length
+    segment = min(bisect.bisect_right(self.lengths, distance) - 1, len(self.loop) - 2)
+    a = self.loop[segment]
+    b = self.loop[segment + 1]
+    f = (distance - self.lengths[segment]) / (self.lengths[segment + 1] - self.lengths[segment])
+    return a[0] + (b[0] - a[0]) * f, a[1] + (b[1] - a[1]) * f, (segment + 2) % self.num_waypoints
+
+  def positions_at(self, times):
+    """Vectorized position_at for an array of times, returns (xs, ys)."""
+    distance = np.asarray(times, dtype=float) * self.speed
+    lead = distance < self.lead_in
+    if self.loop_length > 0:
+      looped = np.mod(distance - self.lead_in, self.loop_length)
+    else:
+      looped = np.zeros_like(distance)
+    segment = np.clip(np.searchsorted(self.cumulative, looped, side="right") - 1, 0, len(self.loop) - 2)
+    span = self.cumulative[segment + 1] - self.cumulative[segment]
+    f = np.divide(looped - self.cumulative[segment], span, out=np.zeros_like(looped), where=span > 0)
+    xs = self.xs[segment] + (self.xs[segment + 1] - self.xs[segment]) * f
+    ys = self.ys[segment] + (self.ys[segment + 1] - self.ys[segment]) * f
+    if self.lead_in > 0:
+      f = np.clip(distance / self.lead_in, 0, 1)
+      xs = np.where(lead, self.start[0] + (self.xs[0] - self.start[0]) * f, xs)
+      ys = np.where(lead, self.start[1] + (self.ys[0] - self.start[1]) * f, ys)
+    return xs, ys
+
+def positions_at(paths, times):
+  """Positions of many paths at once.
+
+  `times` is a single time shared by every path, one time per path, or one
+  row of sample times per path. Returns (xs, ys) with one row per path.
+  """
+  times = np.asarray(times, dtype=float)
+  if times.ndim == 0:
+    times = np.full(len(paths), float(times))
+  xs = np.empty(times.shape)
+  ys = np.empty(times.shape)
+  for index, path in enumerate(paths):
+    xs[index], ys[index] = path.positions_at(times[index])
+  return xs, ys
@@ -0,0 +1,85 @@
+from collections import deque
+from dataclasses import dataclass
+
+@dataclass(frozen=True)
+class QualityTier:
+  name: str
+  num_rays: int
+  # noise points per light for a full 640x480 frame
+  noise_points: int
+  bloom_downscale: int
+  ray_step: int
+
+# lowest to highest, the last one is the game as designed
+QUALITY_TIERS = [
+  QualityTier("low", num_rays=96, noise_points=600, bloom_downscale=30, ray_step=4),
+  QualityTier("medium", num_rays=160, noise_points=1400, bloom_downscale=20, ray_step=3),
+  QualityTier("high", num_rays=256, noise_points=2500, bloom_downscale=15, ray_step=2),
+]
+
+@dataclass(frozen=True)
+class QualityChange:
+  previous: QualityTier
+  tier: QualityTier
+  average_frame_time: float
+
+class QualityGovernor:
+  """Steps through quality tiers based on a rolling window of frame times.
+
+  Drops a tier as soon as a full window averages over budget. Going back up
+  needs `upgrade_windows` windows in a row under `headroom * budget`, and
+  the window starts over after every change, so a tier that only just fits
+  doesn't flip back and forth.
+  """
+  def __init__(self, tiers, frame_budget, window=60, headroom=0.7, upgrade_windows=3):
+    self.tiers = tiers
+    self.index = len(tiers) - 1
+    self.frame_budget = frame_budget
+    self.frame_times = deque(maxlen=window)
+    self.total = 0
+    self.headroom = headroom
+    self.upgrade_windows = upgrade_windows
+    self.good_windows = 0
+    self.listeners = []
+
+  @property
+  def tier(self):
+    return self.tiers[self.index]
+
+  def on_change(self, listener):
+    self.listeners.append(listener)
+
+  def record(self, frame_time):
+    if len(self.frame_times) == self.frame_times.maxlen:
+      self.total -= self.frame_times[0]
+    self.frame_times.append(frame_time)
+    self.total += frame_time
+    if len(self.frame_times) < self.frame_times.maxlen:
+      return None
+
+    average = self.total / len(self.frame_times)
+    if average > self.frame_budget:
+      self.good_windows = 0
+      if self.index > 0:
+        return self.change(self.index - 1, average)
+    elif average < self.frame_budget * self.headroom:
+      self.good_windows += 1
+      self.reset_window()
+      if self.good_windows >= self.upgrade_windows and self.index < len(self.tiers) - 1:
+        return self.change(self.index + 1, average)
+    else:
+      self.good_windows = 0
+    return None
+
+  def reset_window(self):
+    self.frame_times.clear()
+    self.total = 0
+
+  def change(self, index, average):
+    event = QualityChange(self.tier, self.tiers[index], average)
+    self.index = index
+    self.good_windows = 0
+    self.reset_window()
+    for listener in self.listeners:
+      listener(event)
+    return event
@@ -1,5 +1,6 @@
 import pygame
 import math
+import numpy as np
 
 # ---------- CONFIG ----------
 SCREEN_W, SCREEN_H = 800, 600
@@ -12,45 +13,66 @@ class ProceduralBG:
         self.surface = pygame.Surface((self.width, self.height))
         self.time = 0
 
+        # normalized coordinates [-1,1], laid out (x, y) like surfarray
+        # these never change, so only the time-dependent trig runs per frame
+        xs = np.arange(self.width) / self.width * 2 - 1
+        ys = np.arange(self.height) / self.height * 2 - 1
+        self.nx, self.ny = np.meshgrid(xs, ys, indexing="ij")
+        self.r10 = 10 * np.sqrt(self.nx*self.nx + self.ny*self.ny)
+        # cos(5*nx + t) only depends on the column
+        self.nx5 = 5 * xs[:, None]
+
+        # scratch buffers reused every frame
+        self.v = np.empty((self.width, self.height))
+        self.column_wave = np.empty((self.width, 1))
+        self.rgb = np.empty((self.width, self.height, 3), dtype=np.uint8)
+
     def update(self, dt):
         self.time += dt
-        for y in range(self.height):
-            for x in range(self.width):
-                # normalized coordinates [-1,1]
-                nx = x / self.width * 2 - 1
-                ny = y / self.height * 2 - 1
+        v = self.v
+
+        # simple 2D “raymarchish” pattern: moving waves + radial gradient
+        np.subtract(self.r10, self.time*3, out=v)
+        np.sin(v, out=v)
+        np.add(self.nx5, self.time*2, out=self.column_wave)
+        np.cos(self.column_wave, out=self.column_wave)
+        v += self.column_wave
 
-                # simple 2D “raymarchish” pattern: moving waves + radial gradient
-                r = math.sqrt(nx*nx + ny*ny)
-                v = math.sin(10*r - self.time*3) + math.cos(5*nx + self.time*2)
-                color = int((v + 2) / 4 * 255)  # map [-2,2] -> [0,255]
+        # map [-2,2] -> [0,255]
+        v += 2
+        v *= 255 / 4
+        color = v.astype(np.int32)
 
-                # trippy RGB mix
-                self.surface.set_at((x, y), (color, 255 - color, (color * 2) % 256))
+        # trippy RGB mix
+        self.rgb[..., 0] = color
+        self.rgb[..., 1] = 255 - color
+        self.rgb[..., 2] = (color * 2) % 256
+        pygame.surfarray.blit_array(self.surface, self.rgb)
 
     def render(self, target_surface):
         scaled = pygame.transform.scale(self.surface, (SCREEN_W, SCREEN_H))
         target_surface.blit(scaled, (0, 0))
 
 # ---------- MAIN ----------
-pygame.init()
-screen = pygame.display.set_mode((SCREEN_W, SCREEN_H))
-clock = pygame.time.Clock()
-bg = ProceduralBG(SCREEN_W, SCREEN_H, scale=4)
+if __name__ == "__main__":
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_W, SCREEN_H))
+    clock = pygame.time.Clock()
+    bg = ProceduralBG(SCREEN_W, SCREEN_H, scale=4)
 
-running = True
-while running:
-    dt = clock.tick(60) / 1000 
+    running = True
+    while running:
+        dt = clock.tick(60) / 1000 
 
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
 
-    bg.update(dt)
-    bg.render(screen) 
+        bg.update(dt)
+        bg.render(screen) 
 
-    # Scale up for display
-    pygame.display.flip()
-    clock.tick(30)
+        # Scale up for display
+        pygame.display.flip()
+        clock.tick(30)
 
-pygame.quit()
+    pygame.quit()
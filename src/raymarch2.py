@@ -2,122 +2,163 @@ import pygame
 import math
 import time
 import random
+import numpy as np
 
 # ---------- CONFIG ----------
 SCREEN_W, SCREEN_H = 800, 600
-RAY_W, RAY_H = 96, 72          # internal resolution
+RAY_W, RAY_H = 192, 144        # internal resolution
 MAX_STEPS = 40
 MAX_DIST = 18.0
 EPSILON = 0.02
 FPS = 30
 
 # ---------- SDFs ----------
+# points are (x, y, z) tuples, each component either a float or an array,
+# so the same functions work for a single ray and for a whole batch
+def translate(p, offset):
+    return (p[0] - offset[0], p[1] - offset[1], p[2] - offset[2])
+
+def sdf_union(*distances):
+    d = distances[0]
+    for other in distances[1:]:
+        d = np.minimum(d, other)
+    return d
+
 def sdf_sphere(p, r):
-    return math.sqrt(p[0]**2 + p[1]**2 + p[2]**2) - r
+    return np.sqrt(p[0]**2 + p[1]**2 + p[2]**2) - r
 
 def sdf_tunnel(p, t):
     x, y, z = p
-    radius = 1.2 + 0.3 * math.sin(z * 2 + t)
+    radius = 1.2 + 0.3 * np.sin(z * 2 + t)
     thickness = 0.08
-    return abs(math.sqrt(x*x + y*y) - radius) - thickness
+    return np.abs(np.sqrt(x*x + y*y) - radius) - thickness
 
 def scene_sdf(p, t):
-    sphere_pos = (
-        p[0],
-        p[1] + math.sin(t * 1.5) * 0.4,
-        p[2] - 3
-    )
-    return min(
+    sphere_pos = translate(p, (0, -math.sin(t * 1.5) * 0.4, 3))
+    return sdf_union(
         sdf_tunnel(p, t),
         sdf_sphere(sphere_pos, 0.6)
     )
 
 # ---------- RAYMARCH ----------
 def raymarch(ro, rd, t):
-    dist = 0.0
+    """Sphere-trace every ray in rd (shape (3, n)) at once.
+
+    Returns the hit distance per ray, NaN where the ray missed. Rays that hit
+    or run past MAX_DIST are dropped from the working set, so later steps only
+    pay for the rays that are still marching.
+    """
+    hits = np.full(rd.shape[1], np.nan)
+    index = np.arange(rd.shape[1])
+    dx, dy, dz = rd
+    dist = np.zeros(rd.shape[1])
     for _ in range(MAX_STEPS):
         p = (
-            ro[0] + rd[0] * dist,
-            ro[1] + rd[1] * dist,
-            ro[2] + rd[2] * dist,
+            ro[0] + dx * dist,
+            ro[1] + dy * dist,
+            ro[2] + dz * dist,
         )
         d = scene_sdf(p, t)
-        if d < EPSILON:
-            return dist
-        dist += d * 0.9
-        if dist > MAX_DIST:
+        hit = d < EPSILON
+        hits[index[hit]] = dist[hit]
+        dist = dist + d * 0.9
+        alive = ~hit & (dist <= MAX_DIST)
+        if not alive.any():
             break
-    return None
+        index, dist = index[alive], dist[alive]
+        dx, dy, dz = dx[alive], dy[alive], dz[alive]
+    return hits
+
+class ProceduralBG:
+    def __init__(self, width, height, ray_w=RAY_W, ray_h=RAY_H):
+        self.target_size = (width, height)
+        self.width = ray_w
+        self.height = ray_h
+        self.surface = pygame.Surface((ray_w, ray_h))
+        self.prev_surface = pygame.Surface((ray_w, ray_h))
+        self.time = 0
+
+        # pixel grid laid out (x, y) like surfarray
+        self.xs = np.arange(ray_w)[:, None]
+        self.ys = np.arange(ray_h)[None, :]
+        self.ny = np.broadcast_to((self.ys / ray_h - 0.5) * 2 * (ray_h / ray_w), (ray_w, ray_h))
+        self.rgb = np.empty((ray_w, ray_h, 3), dtype=np.uint8)
+
+    def update(self, dt):
+        self.time += dt
+        t = self.time * 0.8
+        w, h = self.width, self.height
+
+        # VHS scanline jitter
+        jitter = np.random.random(h) < 0.12
+        scanline_offsets = np.where(jitter, np.random.randint(-2, 3, h), 0)
+
+        # Occasional vertical tear
+        tear_line = random.randint(0, h) if random.random() < 0.05 else None
+
+        nx = ((self.xs + scanline_offsets[None, :]) / w - 0.5) * 2
+        ny = self.ny
+        length = np.sqrt(nx*nx + ny*ny + 1.5*1.5)
+        rd = np.stack((nx / length, ny / length, 1.5 / length)).reshape(3, -1)
+
+        ro = (0, 0, -5 + t)
+        d = raymarch(ro, rd, t).reshape(w, h)
+
+        base = np.where(np.isnan(d), 10, np.maximum(0, 255 - np.nan_to_num(d * 45).astype(np.int32)))
+
+        # VHS color bleed
+        bleed = np.random.randint(-8, 9, (w, h))
+        r = np.clip(base + bleed, 0, 255)
+        g = np.clip((base * 0.6).astype(np.int32), 0, 255)
+        b = np.clip(255 - base - bleed, 0, 255)
+
+        # Noise shimmer
+        noise = np.random.randint(-12, 13, (w, h))
+        r = np.clip(r + noise, 0, 255)
+        g = np.clip(g + noise, 0, 255)
+        b = np.clip(b + noise, 0, 255)
+
+        self.rgb[..., 0] = r
+        self.rgb[..., 1] = g
+        self.rgb[..., 2] = b
+
+        # Vertical tear color swap
+        if tear_line:
+            torn = self.rgb[:, tear_line + 1:]
+            torn[...] = torn[..., [2, 0, 1]]
+
+        pygame.surfarray.blit_array(self.surface, self.rgb)
+
+        # Temporal smear / phosphor persistence
+        if random.random() < 0.15:
+            self.surface.blit(self.prev_surface, (random.randint(-1, 1), 0))
+
+        self.prev_surface.blit(self.surface, (0, 0))
+
+    def render(self, target_surface):
+        pygame.transform.scale(self.surface, target_surface.get_size(), target_surface)
 
 # ---------- MAIN ----------
-pygame.init()
-screen = pygame.display.set_mode((SCREEN_W, SCREEN_H))
-pygame.display.set_caption("VHS Raymarch Background")
-clock = pygame.time.Clock()
-
-surf = pygame.Surface((RAY_W, RAY_H))
-prev_surf = pygame.Surface((RAY_W, RAY_H))
-
-running = True
-while running:
-    t = time.time() * 0.8
-
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-
-    # VHS scanline jitter
-    scanline_offsets = [
-        random.randint(-2, 2) if random.random() < 0.12 else 0
-        for _ in range(RAY_H)
-    ]
-
-    # Occasional vertical tear
-    tear_line = random.randint(0, RAY_H) if random.random() < 0.05 else None
-
-    for y in range(RAY_H):
-        for x in range(RAY_W):
-            nx = ((x + scanline_offsets[y]) / RAY_W - 0.5) * 2
-            ny = (y / RAY_H - 0.5) * 2 * (RAY_H / RAY_W)
-
-            ro = (0, 0, -5 + t)
-
-            length = math.sqrt(nx*nx + ny*ny + 1.5*1.5)
-            rd = (nx / length, ny / length, 1.5 / length)
-
-            d = raymarch(ro, rd, t)
-
-            if d is None:
-                base = 10
-            else:
-                base = max(0, 255 - int(d * 45))
-
-            # VHS color bleed
-            bleed = random.randint(-8, 8)
-            r = min(255, max(0, base + bleed))
-            g = min(255, max(0, int(base * 0.6)))
-            b = min(255, max(0, 255 - base - bleed))
-
-            # Noise shimmer
-            noise = random.randint(-12, 12)
-            r = min(255, max(0, r + noise))
-            g = min(255, max(0, g + noise))
-            b = min(255, max(0, b + noise))
-
-            # Vertical tear color swap
-            if tear_line and y > tear_line:
-                r, g, b = b, r, g
-
-            surf.set_at((x, y), (r, g, b))
-
-    # Temporal smear / phosphor persistence
-    if random.random() < 0.15:
-        surf.blit(prev_surf, (random.randint(-1, 1), 0))
-
-    prev_surf.blit(surf, (0, 0))
-
-    pygame.transform.scale(surf, (SCREEN_W, SCREEN_H), screen)
-    pygame.display.flip()
-    clock.tick(FPS)
-
-pygame.quit()
+if __name__ == "__main__":
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_W, SCREEN_H))
+    pygame.display.set_caption("VHS Raymarch Background")
+    clock = pygame.time.Clock()
+    bg = ProceduralBG(SCREEN_W, SCREEN_H)
+
+    running = True
+    previous = time.time()
+    while running:
+        now = time.time()
+        dt, previous = now - previous, now
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+
+        bg.update(dt)
+        bg.render(screen)
+        pygame.display.flip()
+        clock.tick(FPS)
+
+    pygame.quit()
@@ -1,95 +1,107 @@
 import pygame
 import math
+import numpy as np
 
 # ---------- CONFIG ----------
 SCREEN_W, SCREEN_H = 800, 600
 
+# number of depth layers (more = deeper but slower)
+DEPTH_STEPS = 6
+
+# time-invariant per-layer fields, shared by every ProceduralBG of the same
+# resolution and depth: (width, height, depth_steps) -> dict of arrays
+_layer_cache = {}
+
+def layer_fields(width, height, depth_steps):
+    key = (width, height, depth_steps)
+    if key not in _layer_cache:
+        # normalized screen coords [-1,1], laid out (x, y) like surfarray
+        nx = (np.arange(width) / width * 2 - 1)[:, None]
+        ny = (np.arange(height) / height * 2 - 1)[None, :]
+
+        # depth from near → far, one entry per layer on axis 0
+        z = (np.arange(depth_steps) / depth_steps)[:, None, None]
+
+        # perspective warp (far layers shrink)
+        px = nx * (1 + z * 1.5)
+        py = ny * (1 + z * 1.5)
+        r = np.sqrt(px*px + py*py)
+
+        # depth falloff (fog), normalized so the layers sum to 1
+        weight = np.exp(-z * 2.5)
+        weight /= weight.sum()
+
+        _layer_cache[key] = {
+            "r10": 10 * r,
+            "px5": 5 * px,
+            # wave speeds (slower movement in the distance)
+            "radial_speed": 3 - z * 2,
+            "column_speed": 2 - z,
+            "weight": weight.ravel(),
+        }
+    return _layer_cache[key]
+
 class ProceduralBG:
-    def __init__(self, width, height, scale=4):
+    def __init__(self, width, height, scale=4, depth_steps=DEPTH_STEPS, interlace=1):
         self.scale = scale  # downscale factor
         self.width = width // scale
         self.height = height // scale
         self.surface = pygame.Surface((self.width, self.height))
         self.time = 0
+        # refresh every n-th row per frame, cycling through the offsets
+        self.interlace = interlace
+        self.frame = 0
+        self.fields = layer_fields(self.width, self.height, depth_steps)
+        self.rgb = np.zeros((self.width, self.height, 3), dtype=np.uint8)
 
     def update(self, dt):
         self.time += dt
+        rows = slice(self.frame % self.interlace, None, self.interlace)
+        self.frame += 1
 
-        for y in range(self.height):
-            for x in range(self.width):
-                # normalized screen coords [-1,1]
-                nx = x / self.width * 2 - 1
-                ny = y / self.height * 2 - 1
-
-                color_acc = 0.0
-                weight_acc = 0.0
-
-                # number of depth layers (more = deeper but slower)
-                DEPTH_STEPS = 6
-
-                for i in range(DEPTH_STEPS):
-                    # depth from near → far
-                    z = i / DEPTH_STEPS
-
-                    # perspective warp (far layers shrink)
-                    px = nx * (1 + z * 1.5)
-                    py = ny * (1 + z * 1.5)
-
-                    r = math.sqrt(px*px + py*py)
-
-                    # wave field (slower movement in the distance)
-                    v = (
-                        math.sin(10*r - self.time*(3 - z*2)) +
-                        math.cos(5*px + self.time*(2 - z))
-                    )
-
-                    # depth falloff (fog)
-                    weight = math.exp(-z * 2.5)
-
-                    color_acc += v * weight
-                    weight_acc += weight
-
-                # normalize accumulated value
-                v = color_acc / weight_acc
+        f = self.fields
+        weight = f["weight"]
 
-                # map to color
-                color = int((v + 2) / 4 * 255)
-                color = max(0, min(255, color))
+        # wave field per layer, weighted and summed over the depth axis
+        radial = np.sin(f["r10"][:, :, rows] - self.time * f["radial_speed"])
+        column = np.cos(f["px5"] + self.time * f["column_speed"])
+        v = np.tensordot(weight, radial, axes=1) + np.tensordot(weight, column, axes=1)
 
-                # depth-based shading
-                self.surface.set_at(
-                    (x, y),
-                    (
-                        color,
-                        int(color * 0.7),
-                        int(255 - color * 0.5)
-                    )
-                )
+        # map to color
+        color = ((v + 2) / 4 * 255).astype(np.int32)
+        color = np.clip(color, 0, 255)
 
+        # depth-based shading
+        rgb = self.rgb[:, rows]
+        rgb[..., 0] = color
+        rgb[..., 1] = (color * 0.7).astype(np.int32)
+        rgb[..., 2] = (255 - color * 0.5).astype(np.int32)
+        pygame.surfarray.blit_array(self.surface, self.rgb)
 
     def render(self, target_surface):
         scaled = pygame.transform.scale(self.surface, (SCREEN_W, SCREEN_H))
         target_surface.blit(scaled, (0, 0))
 
 # ---------- MAIN ----------
-pygame.init()
-screen = pygame.display.set_mode((SCREEN_W, SCREEN_H))
-clock = pygame.time.Clock()
-bg = ProceduralBG(SCREEN_W, SCREEN_H, scale=4)
+if __name__ == "__main__":
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_W, SCREEN_H))
+    clock = pygame.time.Clock()
+    bg = ProceduralBG(SCREEN_W, SCREEN_H, scale=4)
 
-running = True
-while running:
-    dt = clock.tick(60) / 1000 
+    running = True
+    while running:
+        dt = clock.tick(60) / 1000 
 
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
 
-    bg.update(dt)
-    bg.render(screen) 
+        bg.update(dt)
+        bg.render(screen) 
 
-    # Scale up for display
-    pygame.display.flip()
-    clock.tick(30)
+        # Scale up for display
+        pygame.display.flip()
+        clock.tick(30)
 
-pygame.quit()
+    pygame.quit()
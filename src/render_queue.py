@@ -0,0 +1,109 @@
+from dataclasses import dataclass
+
+import pygame
+
+# draw order, lowest first
+LAYER_TILES = 0
+LAYER_BLOOM = 1
+LAYER_LIGHTS = 2
+LAYER_ENTITIES = 3
+LAYER_PARTICLES = 4
+LAYER_UI = 5
+
+# command types, in the order they're drawn within a layer and blend mode
+SPRITE = 0
+RECT = 1
+POLYGON = 2
+CIRCLE = 3
+
+@dataclass
+class DrawCommand:
+  kind: int
+  layer: int
+  blend: int
+  bounds: pygame.Rect
+  args: tuple
+
+class PygameBackend:
+  """Executes batches of draw commands with pygame's software renderer.
+
+  Sprites in a batch go out in a single Surface.blits call with their blend
+  flags. Primitives are drawn straight onto the target with pygame.draw,
+  which doesn't blend, so their blend mode is only used for sorting.
+  """
+  def execute(self, target, kind, blend, commands):
+    if kind == SPRITE:
+      target.blits([(*command.args, blend) for command in commands], doreturn=False)
+    elif kind == RECT:
+      for command in commands:
+        pygame.draw.rect(target, *command.args)
+    elif kind == POLYGON:
+      for command in commands:
+        pygame.draw.polygon(target, *command.args)
+    elif kind == CIRCLE:
+      for command in commands:
+        pygame.draw.circle(target, *command.args)
+
+class RenderQueue:
+  """Collects draw commands over a frame and draws them all in flush().
+
+  flush() drops commands that fall outside the target, sorts the rest by
+  layer, blend mode and type (keeping submission order otherwise) and hands
+  each run of matching commands to the backend as one batch.
+  """
+  def __init__(self, backend=None):
+    self.backend = backend or PygameBackend()
+    self.commands = []
+    self.callbacks = []
+    self.submitted = 0
+    self.culled = 0
+    self.batches = 0
+
+  def submit(self, kind, layer, blend, bounds, args):
+    self.commands.append(DrawCommand(kind, layer, blend, bounds, args))
+
+  def sprite(self, layer, surface, position, blend=0):
+    bounds = pygame.Rect(position, surface.get_size())
+    self.submit(SPRITE, layer, blend, bounds, (surface, bounds.topleft, None))
+
+  def rect(self, layer, color, rect, width=0, blend=0):
+    rect = pygame.Rect(rect)
+    self.submit(RECT, layer, blend, rect, (color, rect, width))
+
+  def polygon(self, layer, color, points, width=0, blend=0):
+    xs = [point[0] for point in points]
+    ys = [point[1] for point in points]
+    bounds = pygame.Rect(min(xs), min(ys), max(xs) - min(xs) + 1, max(ys) - min(ys) + 1)
+    self.submit(POLYGON, layer, blend, bounds, (color, points, width))
+
+  def circle(self, layer, color, center, radius, width=0, blend=0):
+    bounds = pygame.Rect(center[0] - radius, center[1] - radius, radius * 2 + 1, radius * 2 + 1)
+    self.submit(CIRCLE, layer, blend, bounds, (color, center, radius, width))
+
+  def after_flush(self, callback, *args):
+    # for surfaces that have to stay untouched until their commands are drawn
+    self.callbacks.append((callback, args))
+
+  def flush(self, target):
+    viewport = target.get_rect()
+    visible = [command for command in self.commands if command.bounds.colliderect(viewport)]
+    self.submitted = len(self.commands)
+    self.culled = self.submitted - len(visible)
+    self.batches = 0
+    visible.sort(key=lambda command: (command.layer, command.blend, command.kind))
+
+    start = 0
+    while start < len(visible):
+      first = visible[start]
+      end = start + 1
+      while (end < len(visible) and visible[end].layer == first.layer and
+             visible[end].blend == first.blend and visible[end].kind == first.kind):
+        end += 1
+      self.backend.execute(target, first.kind, first.blend, visible[start:end])
+      self.batches += 1
+      start = end
+
+    self.commands.clear()
+    for callback, args in self.callbacks:
+      callback(*args)
+    self.callbacks.clear()
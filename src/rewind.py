@@ -0,0 +1,153 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+# fixed point scales for the delta records
+POSITION_SCALE = 16       # 1/16 px
+VELOCITY_SCALE = 4        # 1/4 px/s
+TIME_SCALE = 10000        # 0.1 ms
+SQUISH_SCALE = 31         # squish_factor is 0..8
+PARTICLE_SCALE = 4        # 1/4 px, relative to the player
+ROTATION_SCALE = 255 / 180
+
+INT16 = np.iinfo(np.int16)
+
+@dataclass
+class RewindFrame:
+  # (x, y, dx, dy, on_ground, jump_timer, squish_factor, particle_timer) and
+  # ((patrol_time, time), ...) per light, the layout Level.snapshot uses
+  level_state: tuple
+  # (x, y, lifetime, starting_rotation) per particle
+  particles: list
+
+class RewindBuffer:
+  """Ring buffer of per-step game state in a fixed memory budget.
+
+  Every step is stored as a fixed-size record of int16 deltas against the
+  most recent keyframe, which holds the full float values. A new keyframe
+  is written every `keyframe_interval` steps, or early when a delta no longer
+  fits in an int16. Decoding a step only needs its own record and its
+  keyframe, so any step can be restored in constant time. Steps whose
+  keyframe has already been overwritten count as expired.
+  """
+  def __init__(self, num_lights, memory_budget=4 * 1024 * 1024, keyframe_interval=30, max_particles=32):
+    self.num_lights = num_lights
+    self.keyframe_interval = keyframe_interval
+    self.max_particles = max_particles
+    self.key_dtype = np.dtype([
+      ("seq", np.uint32),
+      ("player", np.float32, 4),
+      ("lights", np.float32, (num_lights, 2)),
+    ])
+    self.frame_dtype = np.dtype([
+      ("key", np.uint32),
+      ("player", np.int16, 4),
+      ("on_ground", np.uint8),
+      ("squish", np.uint8),
+      ("lights", np.int16, (num_lights, 2)),
+      ("particle_count", np.uint8),
+      ("particle_position", np.int16, (max_particles, 2)),
+      ("particle_lifetime", np.uint16, max_particles),
+      ("particle_rotation", np.uint8, max_particles),
+    ])
+    # leave room for twice the regular keyframes, for the ones forced early
+    per_frame = self.frame_dtype.itemsize + 2 * self.key_dtype.itemsize / keyframe_interval
+    self.capacity = max(2, int(memory_budget // per_frame))
+    self.key_capacity = max(2, 2 * self.capacity // keyframe_interval)
+    self.frames = np.zeros(self.capacity, self.frame_dtype)
+    self.keys = np.zeros(self.key_capacity, self.key_dtype)
+    self.clear()
+
+  @property
+  def nbytes(self):
+    return self.frames.nbytes + self.keys.nbytes
+
+  def clear(self):
+    self.start = 0
+    self.count = 0
+    self.key_seq = 0
+    self.since_key = self.keyframe_interval
+
+  def __len__(self):
+    return self.count
+
+  def write_key(self, player, light_values):
+    self.key_seq += 1
+    key = self.keys[self.key_seq % self.key_capacity]
+    key["seq"] = self.key_seq
+    key["player"] = player
+    key["lights"] = light_values
+    self.since_key = 0
+    # older steps whose keyframe this slot held can no longer be decoded
+    while self.count and self.frames[self.start]["key"] + self.key_capacity <= self.key_seq:
+      self.start = (self.start + 1) % self.capacity
+      self.count -= 1
+    return key
+
+  def record(self, player, lights, particles):
+    player_values = np.array((player.x, player.y, player.dx, player.dy), np.float32)
+    light_values = np.array([(light.patrol_time, light.time) for light in lights], np.float32).reshape(self.num_lights, 2)
+
+    if self.since_key >= self.keyframe_interval:
+      key = self.write_key(player_values, light_values)
+    else:
+      key = self.keys[self.key_seq % self.key_capacity]
+    player_delta = (player_values - key["player"]) * (POSITION_SCALE, POSITION_SCALE, VELOCITY_SCALE, VELOCITY_SCALE)
+    light_delta = (light_values - key["lights"]) * TIME_SCALE
+    if (np.abs(player_delta).max(initial=0) > INT16.max or np.abs(light_delta).max(initial=0) > INT16.max):
+      key = self.write_key(player_values, light_values)
+      player_delta = np.zeros(4)
+      light_delta = np.zeros((self.num_lights, 2))
+    self.since_key += 1
+
+    if self.count == self.capacity:
+      self.start = (self.start + 1) % self.capacity
+      self.count -= 1
+    frame = self.frames[(self.start + self.count) % self.capacity]
+    self.count += 1
+
+    frame["key"] = self.key_seq
+    frame["player"] = np.round(player_delta)
+    frame["on_ground"] = player.on_ground
+    frame["squish"] = round(player.squish_factor * SQUISH_SCALE)
+    frame["lights"] = np.round(light_delta)
+
+    recorded = particles[-self.max_particles:]
+    count = len(recorded)
+    frame["particle_count"] = count
+    if count:
+      values = np.array([(particle.x, particle.y, particle.lifetime, particle.starting_rotation) for particle in recorded])
+      offsets = (values[:, :2] - (player.x, player.y)) * PARTICLE_SCALE
+      frame["particle_position"][:count] = np.clip(np.round(offsets), INT16.min, INT16.max)
+      frame["particle_lifetime"][:count] = np.minimum(np.round(values[:, 2] * TIME_SCALE), 65535)
+      frame["particle_rotation"][:count] = np.round(values[:, 3] * ROTATION_SCALE)
+
+  def decode(self, frame):
+    key = self.keys[int(frame["key"]) % self.key_capacity]
+    x, y, dx, dy = (key["player"].astype(float) +
+                    frame["player"] / (POSITION_SCALE, POSITION_SCALE, VELOCITY_SCALE, VELOCITY_SCALE)).tolist()
+    lights = key["lights"].astype(float) + frame["lights"] / TIME_SCALE
+    player_state = (x, y, dx, dy, bool(frame["on_ground"]), 0, frame["squish"] / SQUISH_SCALE, 0)
+    count = frame["particle_count"]
+    positions = frame["particle_position"][:count] / PARTICLE_SCALE + (x, y)
+    particles = list(zip(positions[:, 0].tolist(), positions[:, 1].tolist(),
+                         (frame["particle_lifetime"][:count] / TIME_SCALE).tolist(),
+                         (frame["particle_rotation"][:count] / ROTATION_SCALE).tolist()))
+    return RewindFrame((player_state, tuple(map(tuple, lights.tolist()))), particles)
+
+  def frame(self, frames_ago=0):
+    """Decoded state from `frames_ago` steps before the newest one."""
+    if not 0 <= frames_ago < self.count:
+      raise IndexError(frames_ago)
+    return self.decode(self.frames[(self.start + self.count - 1 - frames_ago) % self.capacity])
+
+  def rewind(self, frames=1):
+    """Drops the newest `frames` steps and returns the one now on top."""
+    if not self.count:
+      return None
+    frames = min(frames, self.count - 1)
+    self.count -= frames
+    # the next recorded step carries on from the restored one, so start it
+    # against a fresh keyframe
+    self.since_key = self.keyframe_interval
+    return self.frame(0)
@@ -0,0 +1,49 @@
+import pygame
+
+class SurfacePool:
+  """Hands out display-format surfaces and takes them back for reuse.
+
+  Surfaces are keyed by size, extra flags, whether they need per-pixel alpha
+  and the display's pixel format, and are converted with convert/
+  convert_alpha on allocation so blits onto the display path never have to
+  convert pixels. Needs the display mode to be set before the first acquire.
+  """
+  def __init__(self):
+    self.free = {}
+    self.keys = {}
+    self.allocations = 0
+    self.reuses = 0
+    self.releases = 0
+
+  def key(self, size, alpha, flags):
+    display_format = pygame.display.get_surface().get_bitsize()
+    return (int(size[0]), int(size[1])), flags, alpha, display_format
+
+  def acquire(self, size, alpha=False, flags=0):
+    key = self.key(size, alpha, flags)
+    free = self.free.get(key)
+    if free:
+      surface = free.pop()
+      self.reuses += 1
+    else:
+      if alpha:
+        surface = pygame.Surface(key[0], flags | pygame.SRCALPHA).convert_alpha()
+      else:
+        surface = pygame.Surface(key[0], flags).convert()
+      self.allocations += 1
+    self.keys[id(surface)] = key
+    return surface
+
+  def release(self, surface):
+    key = self.keys.pop(id(surface))
+    self.free.setdefault(key, []).append(surface)
+    self.releases += 1
+
+  def stats(self):
+    return {
+      "allocations": self.allocations,
+      "reuses": self.reuses,
+      "releases": self.releases,
+      "in_use": len(self.keys),
+      "free": sum(len(free) for free in self.free.values()),
+    }
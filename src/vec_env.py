@@ -0,0 +1,231 @@
+import math
+
+import numpy as np
+
+from patrol import PatrolPath, positions_at
+
+# action bits, combine them like held keys (left wins over right, like in the game)
+ACTION_LEFT = 1
+ACTION_RIGHT = 2
+ACTION_JUMP = 4
+NUM_ACTIONS = 8
+
+# the player's physics, same values as the Player class in main.py
+PLAYER_WIDTH = 10
+PLAYER_HEIGHT = 20
+PLAYER_SPEED = 200
+GRAVITY = 300
+GRAVITY_CUT = 10
+JUMP_VELOCITY = -300
+GOAL_SIZE = 10
+
+class VecEnv:
+  """Steps many headless copies of the game in lockstep.
+
+  Every instance plays one of `levels` (the same dicts as levels.py),
+  instance i gets levels[level_indices[i]] and by default they're handed out
+  round robin. Player physics, light patrols and the "standing in a light"
+  check run as numpy operations over all instances at once. Nothing is
+  drawn, a player is caught when the straight line from a light to the
+  middle of the player is clear of walls and within `light_range`, which is
+  what the visibility polygons in the game approximate. The wall test along
+  that line is sampled every `sight_step` pixels.
+
+  step() takes one action per instance (ACTION_* bits) and returns
+  (observations, rewards, dones, info). Reaching the goal is worth 1, getting
+  caught -1, and an episode also ends after `max_steps` steps. Instances that
+  are done are reset to the start of their level straight away, so the
+  observations returned for them are already from the new episode; the ones
+  the episode ended on are in info["final_observation"].
+
+  An observation is, in tiles and tiles per second: the player's position and
+  velocity, whether it's on the ground, the offset to the goal, the offset to
+  every light (zero for lights the level doesn't have) and the solid tiles in
+  a square `view_radius` tiles around the player.
+  """
+  def __init__(self, levels, num_envs, level_indices=None, dt=1 / 60, max_steps=3600, tile_size=32,
+               light_speed=100, light_range=998, sight_step=8, view_radius=2):
+    self.num_envs = num_envs
+    self.dt = dt
+    self.max_steps = max_steps
+    self.tile_size = tile_size
+    self.light_range = light_range
+    self.view_radius = view_radius
+    if level_indices is None:
+      level_indices = np.arange(num_envs) % len(levels)
+    self.level_of = np.asarray(level_indices)
+
+    # every tilemap padded out with walls to the size of the largest one
+    height = max(len(level["tilemap"]) for level in levels)
+    width = max(len(level["tilemap"][0]) for level in levels)
+    self.tiles = np.ones((len(levels), height, width), bool)
+    for index, level in enumerate(levels):
+      tilemap = np.array(level["tilemap"]) == 1
+      self.tiles[index, :tilemap.shape[0], :tilemap.shape[1]] = tilemap
+
+    def middle_of_tile(tile_x, tile_y):
+      return tile_x * tile_size + tile_size // 2, tile_y * tile_size + tile_size // 2
+
+    self.max_lights = max(len(level["lights"]) for level in levels)
+    self.paths = []
+    self.level_envs = []
+    start = np.zeros((len(levels), 2))
+    goal = np.zeros((len(levels), 2))
+    for index, level in enumerate(levels):
+      paths = []
+      for light in level["lights"]:
+        route = [middle_of_tile(*point) for point in light["patrol_route"]]
+        paths.append(PatrolPath(middle_of_tile(*light["start_pos"]), route, light_speed))
+      self.paths.append(paths)
+      self.level_envs.append(np.flatnonzero(self.level_of == index))
+      x, y = middle_of_tile(*level["player_start_pos"])
+      start[index] = x - PLAYER_WIDTH // 2, y - PLAYER_HEIGHT // 2
+      x, y = middle_of_tile(*level["goal_pos"])
+      goal[index] = x - GOAL_SIZE // 2, y - GOAL_SIZE // 2
+    self.start = start[self.level_of]
+    self.goal = goal[self.level_of]
+
+    self.light_x = np.zeros((num_envs, self.max_lights))
+    self.light_y = np.zeros((num_envs, self.max_lights))
+    self.light_active = np.zeros((num_envs, self.max_lights), bool)
+    for index, paths in enumerate(self.paths):
+      self.light_active[self.level_envs[index], :len(paths)] = True
+    self.sight_steps = np.arange(1, math.ceil(light_range / sight_step) + 1) * sight_step
+
+    offsets = np.arange(-view_radius, view_radius + 1)
+    self.view_y, self.view_x = np.meshgrid(offsets, offsets, indexing="ij")
+    self.observation_size = 7 + 2 * self.max_lights + self.view_x.size
+
+    self.x = np.zeros(num_envs)
+    self.y = np.zeros(num_envs)
+    self.dx = np.zeros(num_envs)
+    self.dy = np.zeros(num_envs)
+    self.on_ground = np.zeros(num_envs, bool)
+    self.time = np.zeros(num_envs)
+    self.steps = np.zeros(num_envs, int)
+
+  def solid(self, x, y):
+    """point_inside_block for every instance, x and y have the instance as their first axis."""
+    tile_x = np.floor_divide(x, self.tile_size).astype(int)
+    tile_y = np.floor_divide(y, self.tile_size).astype(int)
+    _, height, width = self.tiles.shape
+    outside = (tile_x < 0) | (tile_x >= width) | (tile_y < 0) | (tile_y >= height)
+    level = self.level_of.reshape((-1,) + (1,) * (np.ndim(x) - 1))
+    return outside | self.tiles[level, np.clip(tile_y, 0, height - 1), np.clip(tile_x, 0, width - 1)]
+
+  def reset(self, mask=None):
+    """Puts the instances in `mask` (all of them by default) back at the start."""
+    if mask is None:
+      mask = np.ones(self.num_envs, bool)
+    self.x[mask] = self.start[mask, 0]
+    self.y[mask] = self.start[mask, 1]
+    self.dx[mask] = 0
+    self.dy[mask] = 0
+    self.on_ground[mask] = False
+    self.time[mask] = 0
+    self.steps[mask] = 0
+    self.update_lights()
+    return self.observe()
+
+  def update_lights(self):
+    for paths, envs in zip(self.paths, self.level_envs):
+      if paths and len(envs):
+        times = np.broadcast_to(self.time[envs], (len(paths), len(envs)))
+        xs, ys = positions_at(paths, times)
+        self.light_x[envs, :len(paths)] = xs.T
+        self.light_y[envs, :len(paths)] = ys.T
+
+  def move_player(self, actions):
+    dt = self.dt
+    left = (actions & ACTION_LEFT) != 0
+    right = (actions & ACTION_RIGHT) != 0
+    jump = (actions & ACTION_JUMP) != 0
+    w, h = PLAYER_WIDTH, PLAYER_HEIGHT
+
+    self.dx = np.where(left, -PLAYER_SPEED, np.where(right, PLAYER_SPEED, 0)).astype(float)
+    jumping = jump & self.on_ground
+    self.dy[jumping] = JUMP_VELOCITY
+    self.on_ground &= ~jumping
+    self.dy += np.where(~jump & (self.dy < 0), GRAVITY * GRAVITY_CUT * dt, 0)
+    self.dy += GRAVITY * dt
+
+    # axis separation, move x first, then y
+    self.x += self.dx * dt
+    x_left, x_right = self.x, self.x + w - 1
+    top, bottom = self.y, self.y + h - 1
+    hit_right = (self.dx > 0) & (self.solid(x_right, top + 1) | self.solid(x_right, bottom - 1))
+    hit_left = (self.dx < 0) & (self.solid(x_left, top + 1) | self.solid(x_left, bottom - 1))
+    self.x = np.where(hit_right, np.floor_divide(x_right, self.tile_size) * self.tile_size - w, self.x)
+    self.x = np.where(hit_left, (np.floor_divide(x_left, self.tile_size) + 1) * self.tile_size, self.x)
+    self.dx[hit_right | hit_left] = 0
+
+    self.y += self.dy * dt
+    x_left, x_right = self.x, self.x + w - 1
+    top, bottom = self.y, self.y + h - 1
+    landed = (self.dy > 0) & (self.solid(x_right - 1, bottom) | self.solid(x_left + 1, bottom))
+    self.y = np.where(landed, np.floor_divide(bottom, self.tile_size) * self.tile_size - h, self.y)
+    self.dy[landed] = 0
+    bumped = (self.dy < 0) & (self.solid(x_right - 1, top) | self.solid(x_left + 1, top))
+    self.y = np.where(bumped, (np.floor_divide(top, self.tile_size) + 1) * self.tile_size, self.y)
+    self.dy[bumped] = 0
+    # like the game, this looks below the edges from before the vertical snap
+    self.on_ground = self.solid(x_left + 1, bottom + 1) | self.solid(x_right - 1, bottom + 1)
+
+  def caught(self):
+    center_x = (self.x + PLAYER_WIDTH // 2)[:, None]
+    center_y = (self.y + PLAYER_HEIGHT // 2)[:, None]
+    to_x = center_x - self.light_x
+    to_y = center_y - self.light_y
+    distance = np.hypot(to_x, to_y)
+    in_range = self.light_active & (distance <= self.light_range)
+    # samples along every light -> player line, (instance, light, sample)
+    along = self.sight_steps / np.maximum(distance, 1e-9)[..., None]
+    sample_x = self.light_x[..., None] + to_x[..., None] * along
+    sample_y = self.light_y[..., None] + to_y[..., None] * along
+    blocked = (self.solid(sample_x, sample_y) & (self.sight_steps < distance[..., None])).any(axis=2)
+    return (in_range & ~blocked).any(axis=1)
+
+  def reached_goal(self):
+    gx, gy = self.goal[:, 0], self.goal[:, 1]
+    return ((self.x < gx + GOAL_SIZE) & (gx < self.x + PLAYER_WIDTH) &
+            (self.y < gy + GOAL_SIZE) & (gy < self.y + PLAYER_HEIGHT))
+
+  def observe(self):
+    tile = self.tile_size
+    observation = np.empty((self.num_envs, self.observation_size), np.float32)
+    observation[:, 0] = self.x / tile
+    observation[:, 1] = self.y / tile
+    observation[:, 2] = self.dx / tile
+    observation[:, 3] = self.dy / tile
+    observation[:, 4] = self.on_ground
+    observation[:, 5] = (self.goal[:, 0] - self.x) / tile
+    observation[:, 6] = (self.goal[:, 1] - self.y) / tile
+    lights = 7 + 2 * self.max_lights
+    observation[:, 7:lights:2] = np.where(self.light_active, (self.light_x - self.x[:, None]) / tile, 0)
+    observation[:, 8:lights:2] = np.where(self.light_active, (self.light_y - self.y[:, None]) / tile, 0)
+    center_x = self.x + PLAYER_WIDTH / 2
+    center_y = self.y + PLAYER_HEIGHT / 2
+    view_x = center_x[:, None, None] + self.view_x * tile
+    view_y = center_y[:, None, None] + self.view_y * tile
+    observation[:, lights:] = self.solid(view_x, view_y).reshape(self.num_envs, -1)
+    return observation
+
+  def step(self, actions):
+    actions = np.broadcast_to(np.asarray(actions, int), (self.num_envs,))
+    self.move_player(actions)
+    # the game checks the player against light cast before this step's patrol
+    caught = self.caught()
+    self.time += self.dt
+    self.steps += 1
+    self.update_lights()
+
+    goal = self.reached_goal() & ~caught
+    timeout = ~(goal | caught) & (self.steps >= self.max_steps)
+    rewards = goal.astype(np.float32) - caught
+    dones = goal | caught | timeout
+    observation = self.observe()
+    info = {"goal": goal, "caught": caught, "timeout": timeout}
+    if dones.any():
+      info["final_observation"] = observation.copy()
+      observation = self.reset(dones)
+    return observation, rewards, dones, info